@@ -0,0 +1,145 @@
+"""
+Minimal HTTP load generator (standard library only) reporting throughput and latency
+percentiles per URL.
+
+Compare the sync (WSGI) stack with the async (ASGI) one by starting both servers on the
+same database and hitting the equivalent endpoints:
+
+    gunicorn paczkomaty.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn paczkomaty.asgi:application --workers 4 --port 8001
+
+    python -m benchmarks.http_load -c 50 -n 2000 --cookie "$TOKEN" \\
+        http://127.0.0.1:8000/api/public_parcel_lockers/ \\
+        http://127.0.0.1:8001/api/async/public_parcel_lockers/ \\
+        http://127.0.0.1:8000/api/parcels/ \\
+        http://127.0.0.1:8001/api/async/parcels/
+"""
+import argparse
+import math
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Result:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.extra = {}
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        total = len(latencies) + self.errors
+        return {
+            'name': self.name,
+            'requests': total,
+            'errors': self.errors,
+            'throughput': total / self.elapsed if self.elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+            **self.extra,
+        }
+
+
+def parse_server_timing(header):
+    """Server-Timing header as {metric: {'dur': milliseconds, 'desc': text}}"""
+    metrics = {}
+    for entry in (header or '').split(','):
+        name, *params = [part.strip() for part in entry.split(';')]
+        if not name:
+            continue
+        values = {}
+        for param in params:
+            key, _, value = param.partition('=')
+            value = value.strip('"')
+            values[key] = float(value) if key == 'dur' else value
+        metrics[name] = values
+    return metrics
+
+
+def server_queries(timing):
+    """Query count the server reported in the `db` Server-Timing metric, or None"""
+    count = timing.get('db', {}).get('desc', '').split(' ')[0]
+    return int(count) if count.isdigit() else None
+
+
+def format_table(summaries):
+    columns = ['name', 'requests', 'errors', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    columns += sorted({key for summary in summaries for key in summary} - set(columns))
+    rows = [[
+        f"{summary.get(column, ''):.1f}" if isinstance(summary.get(column), float) else str(summary.get(column, ''))
+        for column in columns
+    ] for summary in summaries]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def load_url(url, requests, concurrency, headers, timeout=30):
+    result = Result(url)
+    queries, db_times = [], []
+
+    def fetch(_):
+        request = urllib.request.Request(url, headers=headers)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                timing = parse_server_timing(response.headers.get('Server-Timing'))
+        except (urllib.error.URLError, OSError):
+            return None, {}
+        return time.perf_counter() - started, timing
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, timing in pool.map(fetch, range(requests)):
+            if latency is None:
+                result.errors += 1
+                continue
+            result.latencies.append(latency)
+            # Reported by paczkomatyapp.middleware.MetricsMiddleware
+            if server_queries(timing) is not None:
+                queries.append(server_queries(timing))
+                db_times.append(timing['db'].get('dur', 0.0))
+    result.elapsed = time.perf_counter() - started
+    if queries:
+        result.extra = {'queries_avg': sum(queries) / len(queries), 'db_ms_avg': sum(db_times) / len(db_times)}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help="concurrent clients")
+    parser.add_argument('-n', '--requests', type=int, default=500, help="requests per URL")
+    parser.add_argument('--warmup', type=int, default=20, help="unmeasured requests per URL")
+    parser.add_argument('--cookie', help="authToken cookie value for authenticated endpoints")
+    args = parser.parse_args(argv)
+
+    headers = {'Accept': 'application/json'}
+    if args.cookie:
+        headers['Cookie'] = f"authToken={args.cookie}"
+
+    summaries = []
+    for url in args.urls:
+        load_url(url, args.warmup, args.concurrency, headers)
+        summaries.append(load_url(url, args.requests, args.concurrency, headers).summary())
+    print(format_table(summaries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Parcel lifecycle benchmark: every virtual user registers, logs in via /api/token/ and sends a
+parcel, a courier account (created by generate_benchmark_data) moves it through the status
+updates, then the user picks it up and reads the map and its parcel list. Reports throughput,
+p50/p95/p99 latency and queries per request for every step.
+
+Generate data first (use a database you can throw away):
+
+    python manage.py migrate
+    python manage.py generate_benchmark_data --lockers 500 --users 1000 --parcels 20000
+
+In process (Django test client, counts the queries of every request; SQLite or Postgres
+through the usual settings, e.g. POSTGRES_DB=paczkomaty for a local Postgres):
+
+    python -m benchmarks.lifecycle -u 100 -c 4
+
+Against a running server (queries per request come from its Server-Timing header):
+
+    python manage.py runserver --noreload
+    python -m benchmarks.lifecycle --base-url http://127.0.0.1:8000 -u 100 -c 8
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.http_load import Result, format_table, parse_server_timing, server_queries
+
+STEPS = ['register', 'login', 'send', 'status_update', 'pickup_code', 'pickup', 'map', 'my_parcels']
+
+
+class InProcessSession:
+    """One virtual user on the Django test client; keeps its auth cookies between requests"""
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        body = json.dumps(data) if data is not None else ''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(
+                method, path, body, content_type='application/json', HTTP_ACCEPT='application/json'
+            )
+        return response.status_code, json.loads(response.content or 'null'), len(queries)
+
+
+class HTTPSession:
+    """One virtual user talking to a running server over HTTP"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, data=None):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(data).encode() if data is not None else None,
+            method=method,
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, body, headers = e.code, e.read(), e.headers
+        # Query count from the Server-Timing header (None when the server does not send it)
+        queries = server_queries(parse_server_timing(headers.get('Server-Timing')))
+        return status, json.loads(body or b'null'), queries
+
+
+class Recorder:
+    def __init__(self):
+        self.results = {step: Result(step) for step in STEPS}
+        self.queries = {step: [] for step in STEPS}
+
+    def call(self, session, step, expected_status, method, path, data=None):
+        """Time one request; returns the response body, or None when the step failed"""
+        started = time.perf_counter()
+        try:
+            status, body, queries = session.request(method, path, data)
+        except (OSError, ValueError):
+            status, body, queries = None, None, None
+        latency = time.perf_counter() - started
+
+        if status != expected_status:
+            self.results[step].errors += 1
+            return None
+        self.results[step].latencies.append(latency)
+        if queries is not None:
+            self.queries[step].append(queries)
+        return body if body is not None else {}
+
+    def summaries(self, elapsed):
+        summaries = []
+        for step in STEPS:
+            result = self.results[step]
+            result.elapsed = elapsed
+            queries = self.queries[step]
+            if queries:
+                result.extra = {'queries_avg': sum(queries) / len(queries), 'queries_max': max(queries)}
+            summaries.append(result.summary())
+        return summaries
+
+
+def courier_session(make_session, username, password):
+    """A session logged in as the courier that makes the status updates (not recorded)"""
+    session = make_session()
+    status, _, _ = session.request('POST', '/api/token/', {'username': username, 'password': password})
+    if status != 200:
+        raise SystemExit(f"Cannot log in as courier '{username}' - run generate_benchmark_data first.")
+    return session
+
+
+def lifecycle(session, courier, recorder, run_id, index, lockers, rng):
+    """The scripted workload of one virtual user; stops at the first failed step"""
+    username, password = f"lc{run_id}-{index}", 'lifecycle-pass'
+    user = recorder.call(session, 'register', 201, 'POST', '/api/user/register/',
+                         {'username': username, 'password': password})
+    if user is None or recorder.call(session, 'login', 200, 'POST', '/api/token/',
+                                     {'username': username, 'password': password}) is None:
+        return
+
+    locker = rng.choice(lockers)
+    parcel = recorder.call(session, 'send', 201, 'POST', '/api/parcels/', {
+        'tracking_number': f"LC{run_id}{index:06d}",
+        'parcel_locker': locker['id'],
+        'size': 'small',
+        'receiver': user['id'],
+    })
+    if parcel is None:
+        return
+
+    for status in ('in_transit', 'awaiting_pickup'):
+        if recorder.call(courier, 'status_update', 200, 'PUT', '/api/update_status/',
+                         {'tracking_number': parcel['tracking_number'], 'status': status}) is None:
+            return
+    code = recorder.call(session, 'pickup_code', 200, 'POST', '/api/get_pickup_code/',
+                         {'tracking_number': parcel['tracking_number']})
+    if code is None or recorder.call(session, 'pickup', 200, 'POST', f"/api/parcels/{parcel['id']}/pickup/",
+                                     {'pickup_code': code['pickup_code']}) is None:
+        return
+
+    lat, lng = locker['latitude'], locker['longitude']
+    recorder.call(session, 'map', 200, 'GET',
+                  f"/api/public_parcel_lockers/map/?bbox={lng - 0.5},{lat - 0.5},{lng + 0.5},{lat + 0.5}&zoom=12")
+    recorder.call(session, 'my_parcels', 200, 'GET', '/api/parcels/')
+
+
+def run(make_session, users, concurrency, seed=0, courier=('bench-courier', 'bench-pass')):
+    """Run the lifecycle for `users` virtual users and return the per-step summaries"""
+    status, lockers, _ = make_session().request('GET', '/api/public_parcel_lockers/')
+    lockers = [locker for locker in lockers or [] if locker['available_slots'].get('small')]
+    if status != 200 or not lockers:
+        raise SystemExit("No parcel lockers with free small slots - run generate_benchmark_data first.")
+
+    recorder = Recorder()
+    run_id = f"{int(time.time()) % 10 ** 8:08d}"
+    rngs = [random.Random(seed + index) for index in range(users)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(
+            lambda index: lifecycle(make_session(), courier_session(make_session, *courier),
+                                    recorder, run_id, index, lockers, rngs[index]),
+            range(users)
+        ))
+    return recorder.summaries(time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-u', '--users', type=int, default=50, help="virtual users, each runs the whole lifecycle")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="virtual users running at the same time")
+    parser.add_argument('--base-url', help="benchmark a running server instead of the in-process test client")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--courier', default='bench-courier', help="account with the update_parcel_status permission")
+    parser.add_argument('--courier-password', default='bench-pass')
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        def make_session():
+            return HTTPSession(args.base_url)
+    else:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'paczkomaty.settings')
+        import django
+        from django.test.utils import setup_test_environment
+
+        django.setup()
+        setup_test_environment()
+        make_session = InProcessSession
+
+    print(format_table(run(
+        make_session, args.users, args.concurrency, args.seed, (args.courier, args.courier_password)
+    )))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -45,7 +46,10 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'paczkomatyapp.middleware.MetricsMiddleware',
+    'paczkomatyapp.middleware.QueryDetectorMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'paczkomatyapp.middleware.CompressionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -125,9 +129,66 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent writers wait instead of failing on lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # File-based test database so multi-threaded tests get real SQLite locking
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Local PostgreSQL instead of SQLite (e.g. for benchmarks): set POSTGRES_DB and friends
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+# Cache for public locker data. Local memory is per process; with several workers switch to a
+# shared backend (e.g. django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache) so invalidations reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'paczkomaty',
+    }
+}
+
+# Upper bound (seconds) for cached locker responses; changes invalidate them earlier
+LOCKER_CACHE_TIMEOUT = 300
+
+# Per-view request time, query count and DB time: Server-Timing header and Prometheus /metrics.
+# The histograms live in process memory, so every worker serves its own. When off, the middleware
+# removes itself from the stack.
+REQUEST_METRICS_ENABLED = True
+
+# Query checks for development and CI: repeated SQL shapes per request (N+1) and slow queries are
+# logged, views declaring `query_budget` are checked against it. STRICT raises QueryBudgetExceeded
+# instead of logging, so tests fail on a blown budget.
+QUERY_DETECTOR = {
+    'ENABLED': DEBUG,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SLOW_QUERY_MS': 100,
+    'STRICT': False,
+}
+
+# Validated JWT -> user snapshots kept per process, so authenticated requests skip the user query.
+# Snapshots expire with the token, after AUTH_USER_CACHE_TIMEOUT seconds at the latest, and are
+# dropped when the user is saved or deleted in the same process.
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Allow placing a parcel in a larger slot when no slot of its own size is free
+PARCEL_SLOT_UPSIZE = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -188,6 +249,13 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cursor pagination for parcel, delivery history and locker slot lists
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Delivery history older than this is moved to the archive table by `archive_delivery_history`
+DELIVERY_HISTORY_RETENTION_DAYS = 90
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
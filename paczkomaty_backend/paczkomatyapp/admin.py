@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import ParcelLocker, LockerSlot, Parcel, DeliveryHistory
+from .cache import bump_availability_version
+from .models import ParcelLocker, LockerSlot, Parcel, DeliveryHistory, LockerKiosk
 
 @admin.register(ParcelLocker)
 class ParcelLockerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'location', 'status', 'small_slots', 'medium_slots', 'large_slots')
+    list_display = ('name', 'location', 'status', 'small_slots', 'medium_slots', 'large_slots',
+                    'free_small_slots', 'free_medium_slots', 'free_large_slots')
     search_fields = ('name', 'location')
     list_filter = ('status',)
+    readonly_fields = ('free_small_slots', 'free_medium_slots', 'free_large_slots')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_availability_version()
 
 @admin.register(LockerSlot)
 class LockerSlotAdmin(admin.ModelAdmin):
@@ -13,6 +20,24 @@ class LockerSlotAdmin(admin.ModelAdmin):
     search_fields = ('slot_number',)
     list_filter = ('size', 'is_occupied')
 
+    def save_model(self, request, obj, form, change):
+        previous_locker_id = form.initial.get('parcel_locker')
+        super().save_model(request, obj, form, change)
+        obj.parcel_locker.refresh_free_slots()
+        if previous_locker_id and previous_locker_id != obj.parcel_locker_id:
+            ParcelLocker.objects.get(pk=previous_locker_id).refresh_free_slots()
+
+    def delete_model(self, request, obj):
+        locker = obj.parcel_locker
+        super().delete_model(request, obj)
+        locker.refresh_free_slots()
+
+    def delete_queryset(self, request, queryset):
+        locker_ids = list(queryset.values_list('parcel_locker_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        for locker in ParcelLocker.objects.filter(pk__in=locker_ids):
+            locker.refresh_free_slots()
+
 @admin.register(Parcel)
 class ParcelAdmin(admin.ModelAdmin):
     list_display = ('tracking_number', 'status', 'locker_slot', 'parcel_locker', 'sender', 'receiver', 'created_at')
@@ -22,4 +47,14 @@ class ParcelAdmin(admin.ModelAdmin):
 @admin.register(DeliveryHistory)
 class DeliveryHistoryAdmin(admin.ModelAdmin):
     list_display = ('parcel', 'event_type', 'event_time')
-    list_filter = ('event_type',)
\ No newline at end of file
+    list_filter = ('event_type',)
+
+    # Historia jest tylko dopisywana
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(LockerKiosk)
+class LockerKioskAdmin(admin.ModelAdmin):
+    list_display = ('user', 'parcel_locker', 'created_at')
+    search_fields = ('user__username', 'parcel_locker__name')
+    raw_id_fields = ('user', 'parcel_locker')
@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    from django.db import connections
+    from .search import ensure_sqlite_fts
+
+    ensure_sqlite_fts(connections[using])
 
 
 class PaczkomatyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'paczkomatyapp'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from .authentication import invalidate_cached_user
+        from .db_hooks import install_query_hooks
+
+        post_migrate.connect(restore_search_triggers, sender=self)
+        post_save.connect(invalidate_cached_user, sender=get_user_model())
+        post_delete.connect(invalidate_cached_user, sender=get_user_model())
+        connection_created.connect(install_query_hooks)
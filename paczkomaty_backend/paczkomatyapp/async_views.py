@@ -0,0 +1,201 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import CookieJWTAuthentication
+from .cache import availability_cache_key, cache_timeout, is_not_modified
+from .events import AVAILABILITY, HISTORY, broker
+from .models import ArchivedDeliveryHistory, DeliveryHistory, Parcel, ParcelLocker
+from .pagination import ParcelCursorPagination
+from .serializers import DeliveryHistorySerializer, ParcelDetailSerializer, ParcelSerializer
+from .views import include_archived, public_locker_data
+
+# Co ile sekund wysyłać komentarz podtrzymujący połączenie
+KEEPALIVE_SECONDS = 15
+
+
+async def authenticate(request):
+    """Resolve the user from the auth cookie the same way the DRF views do"""
+    try:
+        result = await sync_to_async(CookieJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def parse_locker_ids(value):
+    if not value:
+        return None
+    return {int(locker_id) for locker_id in value.split(',')}
+
+
+def is_visible(event, user, locker_ids):
+    if event['type'] == HISTORY:
+        return user.is_staff or user.id in event['user_ids']
+    if event['type'] == AVAILABILITY:
+        return locker_ids is None or event['locker'] in locker_ids
+    return False
+
+
+def format_sse(event):
+    payload = {key: value for key, value in event.items() if key != 'user_ids'}
+    lines = [f"event: {event['type']}"]
+    if event['type'] == HISTORY:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"data: {json.dumps(payload)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def event_stream(user, locker_ids):
+    subscription = broker.subscribe()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if is_visible(event, user, locker_ids):
+                yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+async def parcel_events(request):
+    """
+    Server-sent events: delivery history of the user's parcels (all parcels for admins)
+    and free slot changes, limited to `?lockers=1,2` when given. Needs the ASGI server
+    (paczkomaty.asgi) - under WSGI the stream would hold a worker thread.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    try:
+        locker_ids = parse_locker_ids(request.GET.get('lockers'))
+    except ValueError:
+        return JsonResponse({'detail': 'lockers must be a comma separated list of ids.'}, status=400)
+
+    response = StreamingHttpResponse(event_stream(user, locker_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async (ASGI) variants of the read-heavy endpoints. They return the same JSON as the
+# DRF views, but database access goes through the async ORM instead of a worker thread.
+
+def json_response(data, status=200, **kwargs):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False, **kwargs)
+
+
+def unauthorized():
+    return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+def encode_cursor(parcel):
+    raw = f"{parcel.created_at.isoformat()}|{parcel.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, parcel_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(parcel_id)
+
+
+def user_parcels(user):
+    return Parcel.objects.with_related().visible_to(user)
+
+
+@require_GET
+async def public_parcel_lockers(request):
+    """Async twin of PublicParcelLockerListView (JSON only), sharing its cache and ETags"""
+    key, etag = await sync_to_async(availability_cache_key)(request, 'public_parcel_lockers', 'json')
+    if is_not_modified(request, etag):
+        return HttpResponse(status=304, headers={'ETag': etag})
+
+    data = await cache.aget(key)
+    if data is None:
+        data = [public_locker_data(locker) async for locker in ParcelLocker.objects.all()]
+        await cache.aset(key, data, cache_timeout())
+    return json_response(data, headers={'ETag': etag})
+
+
+@require_GET
+async def parcel_list(request):
+    """Async parcel list with keyset pagination on (created_at, id), newest first"""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+
+    queryset = user_parcels(user)
+    if request.GET.get('status'):
+        queryset = queryset.filter(status=request.GET['status'])
+    if request.GET.get('locker'):
+        queryset = queryset.filter(parcel_locker_id=request.GET['locker'])
+
+    # Users page through their inbox index; the inbox columns hold the parcel's created_at and id
+    created_field, id_field = (
+        ('inbox_created_at', 'inbox_parcel_id') if 'inbox_created_at' in queryset.query.annotations
+        else ('created_at', 'id')
+    )
+    try:
+        page_size = int(request.GET.get('page_size', ParcelCursorPagination.page_size))
+        page_size = max(1, min(page_size, ParcelCursorPagination.max_page_size))
+        if request.GET.get('cursor'):
+            created_at, parcel_id = decode_cursor(request.GET['cursor'])
+            queryset = queryset.filter(
+                Q(**{f'{created_field}__lt': created_at}) | Q(**{created_field: created_at, f'{id_field}__lt': parcel_id})
+            )
+    except ValueError:
+        return json_response({'detail': 'Invalid cursor or page_size.'}, status=400)
+
+    parcels = [parcel async for parcel in queryset.order_by(f'-{created_field}', f'-{id_field}')[:page_size + 1]]
+    next_url = None
+    if len(parcels) > page_size:
+        parcels = parcels[:page_size]
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor(parcels[-1])
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+    return json_response({
+        'next': next_url,
+        'previous': None,
+        'results': ParcelSerializer(parcels, many=True).data
+    })
+
+
+@require_GET
+async def parcel_detail(request, pk):
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    try:
+        parcel = await user_parcels(user).prefetch_related('history').aget(pk=pk)
+    except Parcel.DoesNotExist:
+        return json_response({'detail': 'Not found.'}, status=404)
+    return json_response(ParcelDetailSerializer(parcel).data)
+
+
+@require_GET
+async def parcel_history(request, pk):
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    if not await user_parcels(user).filter(pk=pk).aexists():
+        return json_response({'detail': 'Not found.'}, status=404)
+    history = [event async for event in DeliveryHistory.objects.filter(parcel_id=pk).order_by('-event_time')]
+    if include_archived(request.GET):
+        archived = ArchivedDeliveryHistory.objects.filter(parcel_id=pk).order_by('-event_time')
+        history += [event async for event in archived]
+    return json_response(DeliveryHistorySerializer(history, many=True).data)
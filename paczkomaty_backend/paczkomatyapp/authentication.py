@@ -1,5 +1,68 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+
+class TokenUserCache:
+    """
+    Bounded, thread-safe LRU of validated token id (jti) -> user snapshot.
+    Entries expire with the token, but never later than `timeout` seconds after they were
+    cached, which bounds how stale a snapshot can get in other worker processes.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, jti):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[jti]
+                return None
+            self._entries.move_to_end(jti)
+        # Each request gets its own copy, so changes to request.user never leak into the cache
+        return copy.copy(user)
+
+    def set(self, jti, user, token_expires_at):
+        expires_at = min(token_expires_at, time.time() + self.timeout)
+        with self._lock:
+            self._entries[jti] = (copy.copy(user), expires_at)
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for jti in [jti for jti, (user, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[jti]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_user_cache = TokenUserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop cached snapshots of a saved or deleted user (deactivation, password change, ...)"""
+    token_user_cache.invalidate_user(instance.pk)
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     """
@@ -8,13 +71,25 @@ class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
         # Get the token from cookies
         token = request.COOKIES.get('authToken')
-        
+
         if token is None:
             return None
 
         try:
             # Validate the token
             validated_token = self.get_validated_token(token)
-            return self.get_user(validated_token), validated_token
+            return self.get_cached_user(validated_token), validated_token
         except (InvalidToken, TokenError):
-            return None 
\ No newline at end of file
+            return None
+
+    def get_cached_user(self, validated_token):
+        """get_user() without the user query while the token's snapshot is cached"""
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is None:
+            return self.get_user(validated_token)
+
+        user = token_user_cache.get(jti)
+        if user is None:
+            user = self.get_user(validated_token)
+            token_user_cache.set(jti, user, validated_token['exp'])
+        return user
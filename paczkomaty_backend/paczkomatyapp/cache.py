@@ -0,0 +1,69 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+# Wersja danych o dostępności paczkomatów - zmiana wersji unieważnia wszystkie zapisane odpowiedzi
+AVAILABILITY_VERSION_KEY = 'locker-availability-version'
+
+
+def get_availability_version():
+    version = cache.get(AVAILABILITY_VERSION_KEY)
+    if version is None:
+        cache.add(AVAILABILITY_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(AVAILABILITY_VERSION_KEY)
+    return version
+
+
+def _set_new_version():
+    cache.set(AVAILABILITY_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def bump_availability_version():
+    """
+    Invalidate cached locker data. The version changes right away (so this transaction's
+    own reads are fresh) and once more after commit, dropping anything a concurrent
+    request cached from the not-yet-committed state.
+    """
+    _set_new_version()
+    transaction.on_commit(_set_new_version)
+
+
+def cache_timeout():
+    return getattr(settings, 'LOCKER_CACHE_TIMEOUT', 300)
+
+
+def availability_cache_key(request, scope, renderer_format):
+    """Cache key and ETag of a locker response for the current availability version"""
+    version = get_availability_version()
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f"{scope}:{version}:{path_hash}"
+    # The same data rendered in another format is a different representation
+    etag = f'"{hashlib.md5(f"{key}:{renderer_format}".encode()).hexdigest()}"'
+    return key, etag
+
+
+def is_not_modified(request, etag):
+    return etag in request.headers.get('If-None-Match', '')
+
+
+def cached_availability_response(request, scope, build_data):
+    """
+    Serve `build_data()` from the cache for the current availability version, with an ETag
+    so clients holding the same version get an empty 304 Not Modified.
+    """
+    renderer_format = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    key, etag = availability_cache_key(request, scope, renderer_format)
+
+    if is_not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Vary': 'Accept'})
+
+    data = cache.get(key)
+    if data is None:
+        data = build_data()
+        cache.set(key, data, cache_timeout())
+    return Response(data, headers={'ETag': etag, 'Vary': 'Accept'})
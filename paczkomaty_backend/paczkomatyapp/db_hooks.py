@@ -0,0 +1,36 @@
+"""
+Query hooks bound to the request rather than to a thread's connection.
+
+connection.execute_wrapper() only sees queries of the connection of the calling thread. Async
+views run their ORM calls through sync_to_async() in a worker thread with its own connection,
+so a wrapper installed around `await get_response()` never sees them. Instead every connection
+gets one permanent wrapper (installed when it connects) that runs the hooks stored in a context
+variable - and context variables follow the request into sync_to_async() threads.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+active_hooks = ContextVar('paczkomaty_query_hooks', default=())
+
+
+def run_active_hooks(execute, sql, params, many, context):
+    for hook in reversed(active_hooks.get()):
+        execute = partial(hook, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_hooks(sender, connection, **kwargs):
+    """connection_created receiver; a reconnecting connection keeps its wrappers, so add it once"""
+    if run_active_hooks not in connection.execute_wrappers:
+        connection.execute_wrappers.append(run_active_hooks)
+
+
+@contextmanager
+def query_hook(hook):
+    """Run `hook` (an execute_wrapper() callable) for every query made in the current context"""
+    token = active_hooks.set(active_hooks.get() + (hook,))
+    try:
+        yield hook
+    finally:
+        active_hooks.reset(token)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+from django.db import transaction
+
+HISTORY = 'history'
+AVAILABILITY = 'availability'
+
+
+class Subscription:
+    """Queue of events for one stream, bound to the event loop that consumes it"""
+
+    def __init__(self, loop, max_pending):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, event):
+        # Wolny klient nie blokuje pozostałych - najstarsze zdarzenie jest odrzucane
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class EventBroker:
+    """
+    In-process pub/sub. Publishers are ordinary (sync) model code, subscribers are async
+    streaming responses; events only reach streams served by the same process.
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, max_pending=100):
+        subscription = Subscription(asyncio.get_running_loop(), max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Pętla zdarzeń strumienia została już zamknięta
+                self.unsubscribe(subscription)
+
+    def publish_on_commit(self, event):
+        """Publish once the current transaction commits, so rolled back changes are never announced"""
+        transaction.on_commit(lambda: self.publish(event))
+
+
+broker = EventBroker()
+
+
+def history_event(history):
+    parcel = history.parcel
+    return {
+        'type': HISTORY,
+        'id': history.id,
+        'parcel': parcel.id,
+        'tracking_number': parcel.tracking_number,
+        'event_type': history.event_type,
+        'event_time': history.event_time.isoformat(),
+        # Tylko do filtrowania po stronie serwera, nie trafia do klienta
+        'user_ids': [user_id for user_id in (parcel.sender_id, parcel.receiver_id) if user_id],
+    }
+
+
+def availability_delta_event(locker_id, size, delta):
+    return {'type': AVAILABILITY, 'locker': locker_id, 'size': size, 'delta': delta}
+
+
+def availability_snapshot_event(locker):
+    return {'type': AVAILABILITY, 'locker': locker.pk, 'available_slots': locker.available_slots_by_size}
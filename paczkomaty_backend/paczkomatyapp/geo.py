@@ -0,0 +1,31 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Rozmiar komórki siatki przestrzennej w stopniach (~5.5 km szerokości geograficznej)
+GRID_CELL_DEGREES = 0.05
+
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+
+def grid_cell(degrees):
+    """Index of the grid bucket containing the given latitude or longitude"""
+    return math.floor(float(degrees) / GRID_CELL_DEGREES)
+
+
+def grid_cell_range(lat, lng, radius_km):
+    """Ranges of grid cells ((lat_from, lat_to), (lng_from, lng_to)) covering a circle around a point"""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    # Stopień długości geograficznej kurczy się w stronę biegunów
+    lng_delta = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return (
+        (grid_cell(lat - lat_delta), grid_cell(lat + lat_delta)),
+        (grid_cell(lng - lng_delta), grid_cell(lng + lng_delta)),
+    )
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+
+from .models import ParcelLocker
+from .serializers import ParcelLockerImportSerializer
+
+CSV = 'csv'
+JSON = 'json'
+
+
+def read_locker_rows(stream, file_format):
+    """Read raw locker rows from a CSV (with header) or JSON (list of objects) text stream"""
+    if file_format == CSV:
+        return list(csv.DictReader(stream))
+    if file_format == JSON:
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError("JSON import must contain a list of lockers.")
+        return rows
+    raise ValueError(f"Unsupported import format '{file_format}'.")
+
+
+def read_uploaded_locker_rows(uploaded_file):
+    """Read rows from an uploaded file, guessing the format from its extension"""
+    file_format = CSV if uploaded_file.name.lower().endswith('.csv') else JSON
+    stream = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig')
+    return read_locker_rows(stream, file_format)
+
+
+def import_lockers(rows, batch_size=1000):
+    """
+    Validate all rows and provision the lockers with their slots in batches.
+    Returns (created_count, errors) where errors maps row index to validation errors;
+    nothing is created when any row is invalid.
+    """
+    serializer = ParcelLockerImportSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        errors = serializer.errors
+        # Older DRF versions report list errors positionally, newer ones keyed by index
+        items = errors.items() if isinstance(errors, dict) else enumerate(errors)
+        errors = {index: row_errors for index, row_errors in items if row_errors}
+        return 0, errors
+
+    lockers = [ParcelLocker(**data) for data in serializer.validated_data]
+    ParcelLocker.bulk_provision(lockers, batch_size=batch_size)
+    return len(lockers), {}
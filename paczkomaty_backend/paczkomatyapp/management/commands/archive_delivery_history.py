@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from paczkomatyapp.models import ArchivedDeliveryHistory, DeliveryHistory
+
+
+class Command(BaseCommand):
+    help = "Move delivery history entries older than the retention window into the compact archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=settings.DELIVERY_HISTORY_RETENTION_DAYS,
+            help="Archive entries older than this many days (default: DELIVERY_HISTORY_RETENTION_DAYS)",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help="Number of entries moved per transaction",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only count the entries that would be archived",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        expired = DeliveryHistory.objects.filter(event_time__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} entr(ies) older than {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        archived = 0
+        while True:
+            # Each batch is copied and deleted in its own transaction, so the hot table stays writable
+            with transaction.atomic():
+                batch = list(expired.order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                ArchivedDeliveryHistory.objects.bulk_create(
+                    [ArchivedDeliveryHistory.from_entry(entry) for entry in batch],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+                DeliveryHistory.objects.filter(pk__in=[entry.pk for entry in batch]).delete()
+            archived += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} delivery history entr(ies)."))
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from paczkomatyapp.models import DeliveryHistory, LockerSlot, Parcel, UserParcel
+from paczkomatyapp.pagination import ParcelCursorPagination
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the database query plans of the hot lookup paths. Run it before and after "
+        "'migrate paczkomatyapp 0012' / 'migrate paczkomatyapp' to compare plans without and with the indexes."
+    )
+
+    def hot_queries(self):
+        return {
+            "Parcel by tracking number (update_status, get_pickup_code)":
+                Parcel.objects.filter(tracking_number='TRACK123'),
+            "Free slot lookup (slot allocation)":
+                LockerSlot.objects.filter(parcel_locker_id=1, size=LockerSlot.MEDIUM, is_occupied=False).order_by('id')[:1],
+            "Sent parcels, newest first":
+                Parcel.objects.filter(sender_id=1).order_by('-created_at'),
+            "Received parcels, newest first":
+                Parcel.objects.filter(receiver_id=1).order_by('-created_at'),
+            "My parcels (sender or receiver, user inbox)":
+                Parcel.objects.visible_to(User(id=1)).order_by(*ParcelCursorPagination.inbox_ordering),
+            "My delivery history (user inbox)":
+                DeliveryHistory.objects.filter(parcel_id__in=UserParcel.parcel_ids(1)).order_by('-event_time'),
+            "Parcel history":
+                DeliveryHistory.objects.filter(parcel_id=1).order_by('-event_time'),
+        }
+
+    def handle(self, *args, **options):
+        for name, queryset in self.hot_queries().items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write("")
@@ -0,0 +1,106 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission, User
+from django.core.management.base import BaseCommand, CommandError
+
+from paczkomatyapp.models import LockerSlot, Parcel, ParcelLocker
+
+# Area the generated lockers are spread over (roughly Poland)
+LATITUDE_RANGE = (49.0, 54.8)
+LONGITUDE_RANGE = (14.1, 24.1)
+
+# Share of generated parcels moved along the status pipeline: (status path, weight)
+STATUS_PATHS = [
+    ([], 3),
+    ([Parcel.in_transit], 2),
+    ([Parcel.in_transit, Parcel.awaiting_pickup], 3),
+    ([Parcel.awaiting_pickup, Parcel.picked_up], 1),
+    ([Parcel.awaiting_pickup, Parcel.delivered], 1),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate users, parcel lockers and parcels for load tests and benchmarks "
+        "(see benchmarks/lifecycle.py). Use a database you can throw away."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lockers', type=int, default=100, help="Number of parcel lockers")
+        parser.add_argument('--users', type=int, default=100, help="Number of users")
+        parser.add_argument('--parcels', type=int, default=1000, help="Number of parcels")
+        parser.add_argument('--prefix', default='bench', help="Prefix of generated usernames, names and tracking numbers")
+        parser.add_argument('--password', default='bench-pass', help="Password of every generated user")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed gives the same data")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f"{prefix}-user-").exists():
+            raise CommandError(f"Benchmark data with prefix '{prefix}' already exists, choose another --prefix.")
+        rng = random.Random(options['seed'])
+
+        # One hash for everybody - hashing a password per user would dominate the run
+        password = make_password(options['password'])
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}-user-{i}", password=password) for i in range(options['users'])],
+            batch_size=1000
+        )
+        # Courier account of the lifecycle benchmark's status updates
+        courier = User.objects.create(username=f"{prefix}-courier", password=password)
+        courier.user_permissions.add(Permission.objects.get(codename='update_parcel_status'))
+
+        lockers = ParcelLocker.bulk_provision([
+            ParcelLocker(
+                name=f"{prefix}-{i}"[:30],
+                location=f"{prefix} street {i}",
+                latitude=Decimal(f"{rng.uniform(*LATITUDE_RANGE):.6f}"),
+                longitude=Decimal(f"{rng.uniform(*LONGITUDE_RANGE):.6f}"),
+                status=True,
+            )
+            for i in range(options['lockers'])
+        ])
+
+        created, unplaced = self.send_parcels(rng, prefix, users, lockers, options['parcels'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} user(s), courier '{courier.username}', {len(lockers)} locker(s) and {created} parcel(s); "
+            f"{unplaced} parcel(s) did not fit into the lockers."
+        ))
+
+    def send_parcels(self, rng, prefix, users, lockers, count):
+        if not users or not lockers:
+            return 0, count
+
+        items_by_sender = {}
+        for i in range(count):
+            sender = rng.choice(users)
+            items_by_sender.setdefault(sender, []).append({
+                'tracking_number': f"{prefix.upper()}{i:08d}"[:30],
+                'parcel_locker': rng.choice(lockers).id,
+                'size': rng.choice([LockerSlot.SMALL, LockerSlot.MEDIUM, LockerSlot.MEDIUM, LockerSlot.LARGE]),
+                'receiver': rng.choice(users).id,
+            })
+
+        parcels = []
+        unplaced = 0
+        for sender, items in items_by_sender.items():
+            sent, errors = Parcel.bulk_send(items, sender=sender)
+            parcels += sent
+            unplaced += len(errors)
+
+        paths, weights = zip(*STATUS_PATHS)
+        updates = []
+        pickups = {}
+        for parcel in parcels:
+            for status in rng.choices(paths, weights)[0]:
+                if status in Parcel.PICKUP_CODE_STATUSES:
+                    # Pickups need the code - apply them the way a locker terminal does
+                    pickups.setdefault(parcel.parcel_locker_id, []).append((parcel.id, parcel.pickup_code))
+                else:
+                    updates.append((parcel.tracking_number, status))
+        for start in range(0, len(updates), 1000):
+            Parcel.bulk_update_status(updates[start:start + 1000])
+        for locker_id, events in pickups.items():
+            Parcel.bulk_pickup(locker_id, events)
+        return len(parcels), unplaced
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paczkomatyapp.importers import CSV, JSON, import_lockers, read_locker_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk import parcel lockers (and provision their slots) from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row or JSON file with a list of lockers")
+        parser.add_argument(
+            '--format',
+            choices=[CSV, JSON],
+            help="File format, guessed from the file extension when omitted",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of lockers inserted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or (CSV if path.suffix.lower() == '.csv' else JSON)
+
+        try:
+            with path.open(encoding='utf-8-sig', newline='') as stream:
+                rows = read_locker_rows(stream, file_format)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        created, errors = import_lockers(rows, batch_size=options['batch_size'])
+        if errors:
+            for index, row_errors in errors.items():
+                self.stderr.write(f"Row {index + 1}: {row_errors}")
+            raise CommandError(f"{len(errors)} invalid row(s), nothing was imported.")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} locker(s)."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from paczkomatyapp.cache import bump_availability_version
+from paczkomatyapp.models import ParcelLocker
+
+
+class Command(BaseCommand):
+    help = "Reconcile the free slot counters of parcel lockers against the locker slot table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report lockers with drifted counters, do not fix them",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        # Lock the locker rows so slot allocations wait until the counters are fixed
+        list(ParcelLocker.objects.select_for_update().values_list('pk', flat=True))
+
+        drifted = []
+        for locker in ParcelLocker.count_free_slots():
+            counted = (locker.counted_small, locker.counted_medium, locker.counted_large)
+            stored = (locker.free_small_slots, locker.free_medium_slots, locker.free_large_slots)
+            if counted != stored:
+                self.stdout.write(f"{locker}: stored {stored}, counted {counted}")
+                locker.free_small_slots, locker.free_medium_slots, locker.free_large_slots = counted
+                drifted.append(locker)
+
+        if drifted and not options['dry_run']:
+            ParcelLocker.objects.bulk_update(
+                drifted, ['free_small_slots', 'free_medium_slots', 'free_large_slots'], batch_size=500
+            )
+            bump_availability_version()
+
+        action = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(drifted)} locker(s) with drifted counters."))
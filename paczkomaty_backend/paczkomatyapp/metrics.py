@@ -0,0 +1,94 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Histogram buckets (upper bounds) for request/DB time in seconds and for query counts
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Prometheus-style histogram with a `view` label, kept in process memory"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {view: (list(data['counts']), data['sum']) for view, data in sorted(self._series.items())}
+        for view, (counts, total) in series.items():
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+request_duration = Histogram(
+    'paczkomaty_request_duration_seconds', "Wall time of requests per view.", DURATION_BUCKETS
+)
+db_duration = Histogram(
+    'paczkomaty_db_duration_seconds', "Time spent in database queries per request and view.", DURATION_BUCKETS
+)
+db_queries = Histogram(
+    'paczkomaty_db_queries', "Number of database queries per request and view.", QUERY_BUCKETS
+)
+HISTOGRAMS = (request_duration, db_duration, db_queries)
+
+
+class QueryTimer:
+    """connection.execute_wrapper() hook counting the queries of a request and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def record_request(view, duration, timer):
+    request_duration.observe(view, duration)
+    db_duration.observe(view, timer.duration)
+    db_queries.observe(view, timer.count)
+
+
+def server_timing(duration, timer):
+    """Value of the Server-Timing response header (durations in milliseconds)"""
+    return f'app;dur={duration * 1000:.1f}, db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+
+
+def metrics(request):
+    """Prometheus text exposition of the request histograms of this process"""
+    if not settings.REQUEST_METRICS_ENABLED:
+        raise Http404
+    lines = [line for histogram in HISTOGRAMS for line in histogram.render()]
+    return HttpResponse("\n".join(lines) + "\n", content_type='text/plain; version=0.0.4; charset=utf-8')
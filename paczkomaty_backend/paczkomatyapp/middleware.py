@@ -0,0 +1,138 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+from .db_hooks import query_hook
+from .metrics import QueryTimer, record_request, server_timing
+from .query_detector import QueryLog, check_queries, view_query_budget
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with Brotli when the client accepts it and the `brotli` package
+    is installed, otherwise fall back to Django's gzip compression.
+    """
+    # Brotli quality 5 compresses better than gzip at a similar CPU cost
+    BROTLI_QUALITY = 5
+
+    def process_response(self, request, response):
+        # Server-sent events must reach the client as they are produced
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+
+        compressed = brotli.compress(response.content, quality=self.BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(response.content))
+        # Compressed body differs from the uncompressed one, so a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Measure wall time, query count and database time of every request and expose them per view:
+    as a `Server-Timing` response header and as the histograms served at /metrics.
+    Removed from the middleware stack when REQUEST_METRICS_ENABLED is off.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with query_hook(timer):
+            response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started, timer)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        # Async views query from sync_to_async() threads - query_hook() follows the request there
+        with query_hook(timer):
+            response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started, timer)
+
+    def record(self, request, response, duration, timer):
+        match = request.resolver_match
+        record_request(match.view_name if match else 'unresolved', duration, timer)
+        response.headers['Server-Timing'] = server_timing(duration, timer)
+        return response
+
+
+class QueryDetectorMiddleware:
+    """
+    Development/CI check of the queries of every request: logs repeated SQL shapes (N+1) with
+    the serializer field and stack they come from, logs slow queries and enforces the views'
+    `query_budget` (an exception instead of a log entry in strict mode).
+    Removed from the middleware stack unless QUERY_DETECTOR['ENABLED'] is on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_DETECTOR['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        log = QueryLog()
+        with query_hook(log):
+            response = self.get_response(request)
+        self.check(request, log)
+        return response
+
+    async def __acall__(self, request):
+        log = QueryLog()
+        with query_hook(log):
+            response = await self.get_response(request)
+        self.check(request, log)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_query_budget(view_func, request.method)
+
+    def check(self, request, log):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        check_queries(view, log, getattr(request, 'query_budget', None), settings.QUERY_DETECTOR)
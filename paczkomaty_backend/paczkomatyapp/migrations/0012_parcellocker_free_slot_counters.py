@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_free_slot_counters(apps, schema_editor):
+    ParcelLocker = apps.get_model('paczkomatyapp', 'ParcelLocker')
+    lockers = ParcelLocker.objects.annotate(
+        counted_small=Count('slots', filter=Q(slots__size='small', slots__is_occupied=False)),
+        counted_medium=Count('slots', filter=Q(slots__size='medium', slots__is_occupied=False)),
+        counted_large=Count('slots', filter=Q(slots__size='large', slots__is_occupied=False)),
+    )
+    for locker in lockers:
+        locker.free_small_slots = locker.counted_small
+        locker.free_medium_slots = locker.counted_medium
+        locker.free_large_slots = locker.counted_large
+    ParcelLocker.objects.bulk_update(
+        lockers, ['free_small_slots', 'free_medium_slots', 'free_large_slots'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0011_alter_parcellocker_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcellocker',
+            name='free_large_slots',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parcellocker',
+            name='free_medium_slots',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parcellocker',
+            name='free_small_slots',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_free_slot_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_tracking_numbers(apps, schema_editor):
+    # Older parcels could share a tracking number; keep the oldest and suffix the rest with their id
+    Parcel = apps.get_model('paczkomatyapp', 'Parcel')
+    duplicated = (
+        Parcel.objects.values('tracking_number')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('tracking_number', flat=True)
+    )
+    for tracking_number in list(duplicated):
+        parcels = Parcel.objects.filter(tracking_number=tracking_number).order_by('id')
+        for parcel in parcels[1:]:
+            suffix = f"-{parcel.id}"
+            parcel.tracking_number = tracking_number[:30 - len(suffix)] + suffix
+            parcel.save(update_fields=['tracking_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0012_parcellocker_free_slot_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_tracking_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='parcel',
+            name='tracking_number',
+            field=models.CharField(max_length=30, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryhistory',
+            index=models.Index(fields=['parcel', 'event_time'], name='history_parcel_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lockerslot',
+            index=models.Index(condition=models.Q(('is_occupied', False)), fields=['parcel_locker', 'size', 'id'], name='free_slot_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['sender', 'created_at'], name='parcel_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['receiver', 'created_at'], name='parcel_receiver_created_idx'),
+        ),
+    ]
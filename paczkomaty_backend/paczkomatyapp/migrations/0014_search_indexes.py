@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:35
+
+from django.db import migrations
+
+# Tabela źródłowa -> (tabela FTS5, indeksowane kolumny)
+SQLITE_FTS_TABLES = {
+    'paczkomatyapp_parcel': ('paczkomatyapp_parcel_fts', ['tracking_number']),
+    'paczkomatyapp_parcellocker': ('paczkomatyapp_parcellocker_fts', ['name', 'location']),
+}
+
+# (nazwa indeksu, tabela, kolumna) dla indeksów trigramowych PostgreSQL
+POSTGRES_TRIGRAM_INDEXES = [
+    ('parcel_tracking_trgm_idx', 'paczkomatyapp_parcel', 'tracking_number'),
+    ('parcellocker_name_trgm_idx', 'paczkomatyapp_parcellocker', 'name'),
+    ('parcellocker_location_trgm_idx', 'paczkomatyapp_parcellocker', 'location'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for source, (fts, columns) in SQLITE_FTS_TABLES.items():
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f"new.{column}" for column in columns)
+            old_values = ', '.join(f"old.{column}" for column in columns)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({column_list}, "
+                f"content='{source}', content_rowid='id', tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {column_list} ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in POSTGRES_TRIGRAM_INDEXES:
+            # Wyrażenie musi odpowiadać temu, co generuje lookup icontains
+            schema_editor.execute(
+                f"CREATE INDEX {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for fts, _ in SQLITE_FTS_TABLES.values():
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+    elif vendor == 'postgresql':
+        for name, _, _ in POSTGRES_TRIGRAM_INDEXES:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:28
+
+import math
+
+from django.db import migrations, models
+
+# Frozen copy of paczkomatyapp.geo.grid_cell as of this migration - later changes to the
+# grid must come with their own migration instead of changing what this one writes
+GRID_CELL_DEGREES = 0.05
+
+
+def grid_cell(degrees):
+    return math.floor(float(degrees) / GRID_CELL_DEGREES)
+
+
+def populate_grid_cells(apps, schema_editor):
+    ParcelLocker = apps.get_model('paczkomatyapp', 'ParcelLocker')
+    lockers = list(ParcelLocker.objects.all())
+    for locker in lockers:
+        locker.grid_lat = grid_cell(locker.latitude)
+        locker.grid_lng = grid_cell(locker.longitude)
+    ParcelLocker.objects.bulk_update(lockers, ['grid_lat', 'grid_lng'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0014_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcellocker',
+            name='grid_lat',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parcellocker',
+            name='grid_lng',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='parcellocker',
+            index=models.Index(fields=['grid_lat', 'grid_lng'], name='parcellocker_grid_idx'),
+        ),
+        migrations.RunPython(populate_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0015_parcellocker_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deliveryhistory',
+            name='event_type',
+            field=models.CharField(choices=[('created', 'Created'), ('placed_in_locker', 'Placed in Locker'), ('picked_up', 'Picked Up'), ('in_transit', 'In Transit'), ('delivered', 'Delivered')], max_length=20),
+        ),
+    ]
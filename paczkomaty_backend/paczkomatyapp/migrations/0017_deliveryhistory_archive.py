@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0016_deliveryhistory_status_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDeliveryHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('event', models.PositiveSmallIntegerField()),
+                ('event_time', models.DateTimeField()),
+                ('month', models.PositiveIntegerField()),
+                ('parcel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_history', to='paczkomatyapp.parcel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['parcel', 'event_time'], name='archive_parcel_time_idx'), models.Index(fields=['month', 'id'], name='archive_month_idx')],
+            },
+        ),
+    ]
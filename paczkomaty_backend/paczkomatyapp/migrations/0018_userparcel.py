@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_memberships(apps, schema_editor):
+    Parcel = apps.get_model('paczkomatyapp', 'Parcel')
+    UserParcel = apps.get_model('paczkomatyapp', 'UserParcel')
+    memberships = []
+    for parcel_id, sender_id, receiver_id, created_at in Parcel.objects.values_list(
+        'id', 'sender_id', 'receiver_id', 'created_at'
+    ).iterator():
+        roles = {}
+        if sender_id:
+            roles[sender_id] = 'sender'
+        if receiver_id:
+            roles[receiver_id] = 'both' if receiver_id in roles else 'receiver'
+        memberships.extend(
+            UserParcel(user_id=user_id, parcel_id=parcel_id, role=role, created_at=created_at)
+            for user_id, role in roles.items()
+        )
+    UserParcel.objects.bulk_create(memberships, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0017_deliveryhistory_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserParcel',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('sender', 'Sender'), ('receiver', 'Receiver'), ('both', 'Sender and receiver')], max_length=8)),
+                ('created_at', models.DateTimeField()),
+                ('parcel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='paczkomatyapp.parcel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parcel_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='userparcel_user_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'parcel'), name='unique_user_parcel')],
+            },
+        ),
+        migrations.RunPython(populate_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of paczkomatyapp.pickup_codes.hash_pickup_code as of this migration - a later
+# change of the hashing scheme must come with its own migration
+def hash_pickup_code(locker_id, code):
+    if locker_id is None:
+        return ''
+    key = hmac.new(settings.SECRET_KEY.encode(), f"pickup-code-locker:{locker_id}".encode(), hashlib.sha256).digest()
+    return hmac.new(key, str(code).encode(), hashlib.sha256).hexdigest()
+
+
+def populate_pickup_code_hashes(apps, schema_editor):
+    Parcel = apps.get_model('paczkomatyapp', 'Parcel')
+    parcels = list(Parcel.objects.only('id', 'parcel_locker_id', 'pickup_code'))
+    for parcel in parcels:
+        parcel.pickup_code_hash = hash_pickup_code(parcel.parcel_locker_id, parcel.pickup_code)
+    Parcel.objects.bulk_update(parcels, ['pickup_code_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0018_userparcel'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='parcel',
+            options={'permissions': [('operate_kiosk', 'Can open locker slots with pickup codes')]},
+        ),
+        migrations.AddField(
+            model_name='parcel',
+            name='pickup_code_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['parcel_locker', 'pickup_code_hash'], name='parcel_locker_code_idx'),
+        ),
+        migrations.RunPython(populate_pickup_code_hashes, migrations.RunPython.noop),
+    ]
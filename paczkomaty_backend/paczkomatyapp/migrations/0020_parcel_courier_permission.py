@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0019_parcel_pickup_code_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='parcel',
+            options={'permissions': [('operate_kiosk', 'Can open locker slots with pickup codes'), ('update_parcel_status', 'Can change the status of any parcel')]},
+        ),
+    ]
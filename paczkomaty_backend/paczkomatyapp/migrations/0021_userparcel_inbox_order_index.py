@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0020_parcel_courier_permission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userparcel',
+            name='userparcel_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='userparcel',
+            index=models.Index(fields=['user', 'created_at', 'parcel'], name='userparcel_user_created_idx'),
+        ),
+    ]
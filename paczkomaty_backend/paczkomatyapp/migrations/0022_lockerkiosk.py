@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paczkomatyapp', '0021_userparcel_inbox_order_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockerKiosk',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('parcel_locker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kiosks', to='paczkomatyapp.parcellocker')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='kiosk', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,7 +1,53 @@
+import heapq
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.db import models
+from django.db.models import Count, F, Q
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_availability_version
+from .events import availability_delta_event, availability_snapshot_event, broker, history_event
+from .geo import grid_cell, grid_cell_range, haversine_km
+from .pickup_codes import hash_pickup_code, new_pickup_code, pickup_code_matches
+
+
+# Zmiany liczników wolnych slotów zebrane w bloku deferred_slot_counters(), {(paczkomat, rozmiar): zmiana}
+pending_slot_counters = ContextVar('pending_slot_counters', default=None)
+
+
+@contextmanager
+def deferred_slot_counters():
+    """
+    Odłóż zmiany liczników wolnych slotów do końca bloku i zapisz je jednym UPDATE-em na paczkomat.
+    Wiersz paczkomatu jest wspólny dla wszystkich nadających do niego, więc blokada jego
+    wiersza (PostgreSQL: do końca transakcji) zaczyna się dopiero przy ostatniej instrukcji,
+    a nie przy przydziale slotu. Zagnieżdżone bloki dopisują się do zewnętrznego.
+    """
+    pending = pending_slot_counters.get()
+    if pending is not None:
+        before = Counter(pending)
+        try:
+            yield
+        except BaseException:
+            # Wycofany (zagnieżdżony) blok nie zmienia liczników
+            pending.clear()
+            pending.update(before)
+            raise
+        return
+
+    pending = Counter()
+    token = pending_slot_counters.set(pending)
+    try:
+        yield
+    finally:
+        pending_slot_counters.reset(token)
+    ParcelLocker.apply_free_slot_changes(pending)
 
 
 class ParcelLocker(models.Model):
@@ -14,39 +60,168 @@ class ParcelLocker(models.Model):
     small_slots = models.PositiveIntegerField(default=10)
     medium_slots = models.PositiveIntegerField(default=8)
     large_slots = models.PositiveIntegerField(default=5)
+    # Liczniki wolnych slotów utrzymywane razem ze zmianami zajętości slotów
+    free_small_slots = models.PositiveIntegerField(default=0)
+    free_medium_slots = models.PositiveIntegerField(default=0)
+    free_large_slots = models.PositiveIntegerField(default=0)
+    # Komórka siatki przestrzennej (indeks przestrzenny do wyszukiwania najbliższych paczkomatów)
+    grid_lat = models.IntegerField(default=0)
+    grid_lng = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['grid_lat', 'grid_lng'], name='parcellocker_grid_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.location})"
 
+    def update_grid_cell(self):
+        self.grid_lat = grid_cell(self.latitude)
+        self.grid_lng = grid_cell(self.longitude)
+
+    @classmethod
+    def nearest(cls, lat, lng, radius_km, size=None, limit=10):
+        """
+        Najbliższe paczkomaty w promieniu `radius_km`, opcjonalnie tylko z wolnym slotem
+        (z uwzględnieniem polityki upsize) dla paczki danego rozmiaru.
+        Zwraca listę par (odległość w km, paczkomat) posortowaną rosnąco.
+        """
+        (lat_from, lat_to), (lng_from, lng_to) = grid_cell_range(lat, lng, radius_km)
+        candidates = cls.objects.filter(grid_lat__range=(lat_from, lat_to), grid_lng__range=(lng_from, lng_to))
+        if size:
+            has_free_slot = Q()
+            for candidate_size in LockerSlot.allocation_sizes(size):
+                has_free_slot |= Q(**{f"{cls.free_slots_field(candidate_size)}__gt": 0})
+            candidates = candidates.filter(has_free_slot)
+
+        in_range = []
+        for locker in candidates:
+            distance = haversine_km(lat, lng, float(locker.latitude), float(locker.longitude))
+            if distance <= radius_km:
+                in_range.append((distance, locker))
+        return heapq.nsmallest(limit, in_range, key=lambda item: item[0])
+
+    @property
+    def available_slots_by_size(self):
+        return {
+            LockerSlot.SMALL: self.free_small_slots,
+            LockerSlot.MEDIUM: self.free_medium_slots,
+            LockerSlot.LARGE: self.free_large_slots,
+        }
+
+    @property
+    def available_slots_count(self):
+        return self.free_small_slots + self.free_medium_slots + self.free_large_slots
+
+    @staticmethod
+    def free_slots_field(size):
+        return f"free_{size}_slots"
+
+    @classmethod
+    def adjust_free_slots(cls, locker_id, size, delta):
+        """Atomowa zmiana licznika wolnych slotów danego rozmiaru (odłożona w deferred_slot_counters())"""
+        pending = pending_slot_counters.get()
+        if pending is not None:
+            pending[(locker_id, size)] += delta
+        else:
+            cls.apply_free_slot_changes({(locker_id, size): delta})
+
+    @classmethod
+    def apply_free_slot_changes(cls, changes):
+        """Zapis zmian liczników {(paczkomat, rozmiar): zmiana} - jeden UPDATE na paczkomat, w kolejności id"""
+        by_locker = defaultdict(dict)
+        for (locker_id, size), delta in changes.items():
+            if delta:
+                by_locker[locker_id][size] = delta
+        for locker_id in sorted(by_locker):
+            deltas = by_locker[locker_id]
+            cls.objects.filter(pk=locker_id).update(**{
+                cls.free_slots_field(size): F(cls.free_slots_field(size)) + delta for size, delta in deltas.items()
+            })
+            for size, delta in deltas.items():
+                broker.publish_on_commit(availability_delta_event(locker_id, size, delta))
+        if by_locker:
+            bump_availability_version()
+
+    @classmethod
+    def count_free_slots(cls):
+        """Rzeczywista liczba wolnych slotów wg rozmiaru, policzona z tabeli slotów"""
+        return cls.objects.annotate(
+            counted_small=Count('slots', filter=Q(slots__size=LockerSlot.SMALL, slots__is_occupied=False)),
+            counted_medium=Count('slots', filter=Q(slots__size=LockerSlot.MEDIUM, slots__is_occupied=False)),
+            counted_large=Count('slots', filter=Q(slots__size=LockerSlot.LARGE, slots__is_occupied=False)),
+        )
+
+    def refresh_free_slots(self):
+        """Przelicz liczniki wolnych slotów na podstawie tabeli slotów"""
+        counted = ParcelLocker.count_free_slots().get(pk=self.pk)
+        self.free_small_slots = counted.counted_small
+        self.free_medium_slots = counted.counted_medium
+        self.free_large_slots = counted.counted_large
+        ParcelLocker.objects.filter(pk=self.pk).update(
+            free_small_slots=self.free_small_slots,
+            free_medium_slots=self.free_medium_slots,
+            free_large_slots=self.free_large_slots,
+        )
+        bump_availability_version()
+        broker.publish_on_commit(availability_snapshot_event(self))
+
+    def reset_free_slots(self):
+        # Wszystkie sloty nowego paczkomatu są wolne
+        self.free_small_slots = self.small_slots
+        self.free_medium_slots = self.medium_slots
+        self.free_large_slots = self.large_slots
+
+    def build_slots(self):
+        """Niezapisane sloty dla nowego paczkomatu (S1.., M1.., L1..)"""
+        slots = []
+        for prefix, size, count in (
+            ('S', LockerSlot.SMALL, self.small_slots),
+            ('M', LockerSlot.MEDIUM, self.medium_slots),
+            ('L', LockerSlot.LARGE, self.large_slots),
+        ):
+            for i in range(1, count + 1):
+                slots.append(LockerSlot(parcel_locker=self, slot_number=f"{prefix}{i}", size=size))
+        return slots
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        if is_new:
+            self.reset_free_slots()
+        self.update_grid_cell()
         super().save(*args, **kwargs)
-        
+
         if is_new:
-            # Create small slots
-            for i in range(1, self.small_slots + 1):
-                LockerSlot.objects.create(
-                    parcel_locker=self,
-                    slot_number=f"S{i}",
-                    size=LockerSlot.SMALL
-                )
-            
-            # Create medium slots
-            for i in range(1, self.medium_slots + 1):
-                LockerSlot.objects.create(
-                    parcel_locker=self,
-                    slot_number=f"M{i}",
-                    size=LockerSlot.MEDIUM
-                )
-            
-            # Create large slots
-            for i in range(1, self.large_slots + 1):
-                LockerSlot.objects.create(
-                    parcel_locker=self,
-                    slot_number=f"L{i}",
-                    size=LockerSlot.LARGE
-                )
+            # Wszystkie sloty w jednym wsadowym INSERT
+            LockerSlot.objects.bulk_create(self.build_slots())
+        bump_availability_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_availability_version()
+        return result
+
+    @classmethod
+    def bulk_provision(cls, lockers, batch_size=1000):
+        """
+        Hurtowe tworzenie paczkomatów razem z ich slotami.
+        Każda paczka `batch_size` paczkomatów to jedna transakcja z wsadowymi INSERT-ami.
+        """
+        lockers = list(lockers)
+        for start in range(0, len(lockers), batch_size):
+            batch = lockers[start:start + batch_size]
+            with transaction.atomic():
+                for locker in batch:
+                    locker.reset_free_slots()
+                    locker.update_grid_cell()
+                cls.objects.bulk_create(batch)
+                slots = [slot for locker in batch for slot in locker.build_slots()]
+                LockerSlot.objects.bulk_create(slots, batch_size=batch_size)
+        bump_availability_version()
+        return lockers
 
 
 class LockerSlot(models.Model):
@@ -75,10 +250,142 @@ class LockerSlot(models.Model):
                 name='unique_slot_per_locker'
             )
         ]
+        indexes = [
+            # Częściowy indeks tylko na wolnych slotach - wyszukiwanie slotu przy nadawaniu paczki
+            models.Index(
+                fields=['parcel_locker', 'size', 'id'],
+                condition=Q(is_occupied=False),
+                name='free_slot_lookup_idx'
+            ),
+        ]
+
+    # Kolejność rozmiarów przy przydziale większego slotu ("upsize")
+    SIZE_ORDER = [SMALL, MEDIUM, LARGE]
+
+    # Ilu wolnych kandydatów próbujemy przejąć na bazach bez SKIP LOCKED
+    CLAIM_CANDIDATES = 10
 
     def __str__(self):
         return f"{self.parcel_locker.name} - Slot {self.slot_number}"
 
+    @classmethod
+    def allocation_sizes(cls, size, allow_upsize=None):
+        """Rozmiary slotów, w których można umieścić paczkę danego rozmiaru"""
+        if allow_upsize is None:
+            allow_upsize = getattr(settings, 'PARCEL_SLOT_UPSIZE', False)
+        if not allow_upsize:
+            return [size]
+        return cls.SIZE_ORDER[cls.SIZE_ORDER.index(size):]
+
+    @classmethod
+    def claim_free_slot(cls, parcel_locker_id, size, allow_upsize=None):
+        """
+        Zajmij wolny slot w paczkomacie i zaktualizuj licznik wolnych slotów.
+        Zwraca zajęty slot albo None, gdy żaden pasujący slot nie jest wolny.
+        """
+        for candidate_size in cls.allocation_sizes(size, allow_upsize):
+            slot = cls._claim(parcel_locker_id, candidate_size)
+            if slot:
+                ParcelLocker.adjust_free_slots(parcel_locker_id, candidate_size, -1)
+                return slot
+        return None
+
+    @classmethod
+    @transaction.atomic
+    def claim_free_slots(cls, parcel_locker_id, sizes, allow_upsize=None):
+        """
+        Przydział slotów dla wielu paczek w jednym paczkomacie w jednym przebiegu blokującym.
+        `sizes` to rozmiary kolejnych paczek; zwraca listę slotów (None dla paczek bez miejsca)
+        w tej samej kolejności.
+        """
+        wanted = {candidate for size in sizes for candidate in cls.allocation_sizes(size, allow_upsize)}
+        free_slots = cls.objects.filter(
+            parcel_locker_id=parcel_locker_id,
+            size__in=wanted,
+            is_occupied=False
+        ).order_by('id')
+        if connection.features.has_select_for_update:
+            free_slots = free_slots.select_for_update(
+                skip_locked=connection.features.has_select_for_update_skip_locked
+            )
+
+        pools = defaultdict(deque)
+        for slot in free_slots:
+            pools[slot.size].append(slot)
+
+        # Najpierw sloty właściwego rozmiaru, większe tylko dla paczek, które zostały bez miejsca
+        assigned = [pools[size].popleft() if pools[size] else None for size in sizes]
+        for index, size in enumerate(sizes):
+            if assigned[index] is None:
+                for candidate_size in cls.allocation_sizes(size, allow_upsize)[1:]:
+                    if pools[candidate_size]:
+                        assigned[index] = pools[candidate_size].popleft()
+                        break
+
+        claimed = [slot for slot in assigned if slot]
+        if claimed:
+            cls.objects.filter(pk__in=[slot.pk for slot in claimed]).update(
+                is_occupied=True,
+                last_updated=timezone.now()
+            )
+            for slot in claimed:
+                slot.is_occupied = True
+            for size, count in Counter(slot.size for slot in claimed).items():
+                ParcelLocker.adjust_free_slots(parcel_locker_id, size, -count)
+        return assigned
+
+    @classmethod
+    @transaction.atomic
+    def _claim(cls, parcel_locker_id, size):
+        free_slots = cls.objects.filter(
+            parcel_locker_id=parcel_locker_id,
+            size=size,
+            is_occupied=False
+        ).order_by('id')
+
+        if connection.features.has_select_for_update_skip_locked:
+            # Równoległe transakcje pomijają wiersze zablokowane przez inne i nie czekają w kolejce
+            slot = free_slots.select_for_update(skip_locked=True).first()
+            if slot:
+                slot.is_occupied = True
+                slot.save(update_fields=['is_occupied', 'last_updated'])
+            return slot
+
+        # Bez SKIP LOCKED (SQLite): compare-and-set - UPDATE uda się tylko, jeśli slot nadal jest wolny
+        for slot in free_slots[:cls.CLAIM_CANDIDATES]:
+            claimed = cls.objects.filter(pk=slot.pk, is_occupied=False).update(
+                is_occupied=True,
+                last_updated=timezone.now()
+            )
+            if claimed:
+                slot.is_occupied = True
+                return slot
+        return None
+
+
+class ParcelQuerySet(models.QuerySet):
+    def with_related(self):
+        """Dołącz relacje serializowane na liście paczek, żeby uniknąć zapytań per wiersz"""
+        return self.select_related('parcel_locker', 'locker_slot', 'sender', 'receiver')
+
+    def visible_to(self, user):
+        """
+        Paczki nadane lub odbierane przez użytkownika (wszystkie dla administratora).
+        Dla użytkownika z kolumnami skrzynki inbox_created_at/inbox_parcel_id - sortowanie po nich
+        czyta zakres indeksu skrzynki zamiast sortować wszystkie paczki użytkownika.
+        """
+        if user.is_staff:
+            return self
+        return self.filter(memberships__user=user).annotate(
+            inbox_created_at=F('memberships__created_at'),
+            inbox_parcel_id=F('memberships__parcel_id')
+        )
+
+    def for_transition(self):
+        """Paczki zablokowane do zmiany statusu, razem ze slotem (blokowany jest tylko wiersz paczki)"""
+        lock_of = ('self',) if connection.features.has_select_for_update_of else ()
+        return self.select_related('locker_slot').select_for_update(of=lock_of)
+
 
 class Parcel(models.Model):
     preparing = 'preparing'
@@ -95,8 +402,22 @@ class Parcel(models.Model):
         (delivered, 'Delivered')
     ]
 
+    # Dozwolone zmiany statusu paczki
+    ALLOWED_TRANSITIONS = {
+        preparing: {in_transit, awaiting_pickup},
+        in_transit: {awaiting_pickup},
+        awaiting_pickup: {picked_up, delivered},
+        picked_up: {delivered},
+        delivered: set(),
+    }
+
+    # Statusy, po których paczka nie zajmuje już slotu
+    SLOT_RELEASING_STATUSES = {picked_up, delivered}
+    # Statusy osiągalne tylko po sprawdzeniu kodu odbioru (pickup(), terminal paczkomatu)
+    PICKUP_CODE_STATUSES = {picked_up}
+
     id = models.AutoField(primary_key=True)
-    tracking_number = models.CharField(max_length=30)
+    tracking_number = models.CharField(max_length=30, unique=True)
     parcel_locker = models.ForeignKey(ParcelLocker, on_delete=models.CASCADE,null=True)
     locker_slot = models.ForeignKey(LockerSlot, on_delete=models.CASCADE, null=True, blank=True)
     size = models.CharField(max_length=6, choices=LockerSlot.SIZE_CHOICES, default=LockerSlot.MEDIUM)
@@ -104,14 +425,33 @@ class Parcel(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_parcels', null=True)
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_parcels', null=True)
     pickup_code = models.CharField(max_length=30)
+    # HMAC kodu odbioru kluczem paczkomatu - wyszukiwanie "paczkomat + kod" jednym zapytaniem
+    pickup_code_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ParcelQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listy "moje paczki" filtrowane po nadawcy/odbiorcy i sortowane po dacie
+            models.Index(fields=['sender', 'created_at'], name='parcel_sender_created_idx'),
+            models.Index(fields=['receiver', 'created_at'], name='parcel_receiver_created_idx'),
+            models.Index(fields=['parcel_locker', 'pickup_code_hash'], name='parcel_locker_code_idx'),
+        ]
+        permissions = [
+            # Konto terminala paczkomatu (kiosku) - otwieranie skrytek kodem odbioru
+            ('operate_kiosk', 'Can open locker slots with pickup codes'),
+            # Kurier - wsadowa zmiana statusu dowolnych paczek
+            ('update_parcel_status', 'Can change the status of any parcel'),
+        ]
+
     def clean(self):
         # Walidacja czy slot należy do wybranego paczkomatu
-        if self.locker_slot and self.locker_slot.parcel_locker != self.parcel_locker:
+        if self.locker_slot and self.locker_slot.parcel_locker_id != self.parcel_locker_id:
             raise ValidationError("Wybrany slot musi należeć do wybranego paczkomatu.")
 
     @transaction.atomic
+    @deferred_slot_counters()
     def save(self, *args, **kwargs):
         # Sprawdzanie statusu przed zapisem
         is_new = self.pk is None
@@ -119,13 +459,26 @@ class Parcel(models.Model):
         # Jeśli to nowa paczka lub zmiana statusu na odebrane, zajmij/zwolnij slot
         if is_new and not self.locker_slot:
             self.locker_slot = self.get_first_available_slot()
+        # Kod odbioru nadaje serwer - unikalny wśród paczek czekających w tym paczkomacie
+        if is_new and not self.pickup_code and self.parcel_locker_id:
+            self.pickup_code, = self.issue_pickup_codes(self.parcel_locker_id, 1)
 
         # Walidacja
         self.clean()
 
+        self.pickup_code_hash = hash_pickup_code(self.parcel_locker_id, self.pickup_code)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'pickup_code', 'parcel_locker'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'pickup_code_hash'}
+
         # Zapisz paczke
         super().save(*args, **kwargs)
 
+        # Aktualizuj skrzynki nadawcy i odbiorcy, jeśli mogły się zmienić
+        update_fields = kwargs.get('update_fields')
+        if is_new or update_fields is None or {'sender', 'receiver'} & set(update_fields):
+            UserParcel.sync([self], replace=not is_new)
+
         # Utwórz wpis w historii dla nowej paczki
         if is_new:
             DeliveryHistory.objects.create(
@@ -134,19 +487,11 @@ class Parcel(models.Model):
             )
 
     @transaction.atomic
-    def get_first_available_slot(self):
-        # Wybór pierwszego wolnego slotu w paczkomacie o odpowiednim rozmiarze
-        available_slot = LockerSlot.objects.filter(
-            parcel_locker=self.parcel_locker,
-            size=self.size,
-            is_occupied=False
-        ).select_for_update().first()
+    def get_first_available_slot(self, allow_upsize=None):
+        # Przydział wolnego slotu w paczkomacie o odpowiednim (lub większym) rozmiarze
+        available_slot = LockerSlot.claim_free_slot(self.parcel_locker_id, self.size, allow_upsize)
 
         if available_slot:
-            # Oznacz slot jako zajęty
-            available_slot.is_occupied = True
-            available_slot.save()
-
             # Dodaj wpis do historii
             if self.pk:  # Jeśli paczka już istnieje
                 DeliveryHistory.objects.create(
@@ -159,50 +504,482 @@ class Parcel(models.Model):
     @transaction.atomic
     def pickup(self, provided_code):
         """Obsługa odbioru paczki"""
-        # Sprawdź kod odbioru
-        if provided_code != self.pickup_code:
+        # Sprawdź kod odbioru (porównanie skrótów w stałym czasie)
+        if not pickup_code_matches(self.parcel_locker_id, provided_code, self.pickup_code_hash):
             raise ValidationError("Nieprawidłowy kod odbioru.")
 
         # Sprawdź czy paczka jest gotowa do odbioru
         if self.status != self.awaiting_pickup:
             raise ValidationError("Ta paczka nie jest gotowa do odbioru.")
 
-        # Zwolnij slot
-        if self.locker_slot:
-            self.locker_slot.is_occupied = False
-            self.locker_slot.save()
+        self.transition_to(self.picked_up, code_verified=True)
+        return True
 
-        # Zmień status paczki
-        self.status = self.picked_up
-        self.save()
+    def can_transition_to(self, new_status, code_verified=False):
+        if new_status in self.PICKUP_CODE_STATUSES and not code_verified:
+            return False
+        return new_status in self.ALLOWED_TRANSITIONS.get(self.status, set())
 
-        # Dodaj wpis do historii
-        DeliveryHistory.objects.create(
-            parcel=self,
-            event_type=DeliveryHistory.PICKED_UP
+    def check_transition(self, new_status, code_verified=False):
+        if new_status in self.PICKUP_CODE_STATUSES and not code_verified:
+            raise ValidationError("Odbiór paczki wymaga podania kodu odbioru.")
+        if not self.can_transition_to(new_status, code_verified):
+            raise ValidationError(f"Nie można zmienić statusu z '{self.status}' na '{new_status}'.")
+
+    @transaction.atomic
+    @deferred_slot_counters()
+    def transition_to(self, new_status, code_verified=False):
+        """
+        Zmiana statusu paczki: walidacja przejścia, zajęcie/zwolnienie slotu, jeden UPDATE paczki
+        i jeden INSERT do historii - wszystko w jednej transakcji. Zwraca wpis historii.
+        `code_verified` - kod odbioru został sprawdzony (wymagane dla PICKUP_CODE_STATUSES).
+        """
+        self.check_transition(new_status, code_verified)
+
+        if new_status in self.SLOT_RELEASING_STATUSES:
+            self.release_slot()
+        elif new_status == self.awaiting_pickup and self.locker_slot_id is None:
+            slot = LockerSlot.claim_free_slot(self.parcel_locker_id, self.size)
+            if slot is None:
+                raise ValidationError("Brak wolnych slotów w wybranym paczkomacie.")
+            self.locker_slot = slot
+
+        self.status = new_status
+        type(self).objects.filter(pk=self.pk).update(status=new_status, locker_slot=self.locker_slot_id)
+        return DeliveryHistory.objects.create(parcel=self, event_type=DeliveryHistory.for_status(new_status))
+
+    def release_slot(self):
+        """Zwolnienie slotu zajmowanego przez paczkę (warunkowy UPDATE - bez ponownego odczytu)"""
+        if self.locker_slot_id is None:
+            return False
+        slot = self.locker_slot
+        released = LockerSlot.objects.filter(pk=slot.pk, is_occupied=True).update(
+            is_occupied=False,
+            last_updated=timezone.now()
+        )
+        slot.is_occupied = False
+        if released:
+            ParcelLocker.adjust_free_slots(slot.parcel_locker_id, slot.size, 1)
+        return bool(released)
+
+    @classmethod
+    def issue_pickup_codes(cls, parcel_locker_id, count):
+        """
+        Nowe kody odbioru dla `count` paczek w paczkomacie, różne między sobą i od kodów paczek,
+        które jeszcze w nim czekają (find_for_pickup musi trafiać w jedną paczkę). Kandydaci są
+        sprawdzani jednym zapytaniem po indeksie (paczkomat, skrót kodu); kolizje losowane ponownie.
+        """
+        codes = {}
+        while len(codes) < count:
+            candidates = {}
+            while len(codes) + len(candidates) < count:
+                code = new_pickup_code()
+                code_hash = hash_pickup_code(parcel_locker_id, code)
+                if code_hash not in codes:
+                    candidates[code_hash] = code
+            in_use = set(cls.objects.filter(
+                parcel_locker_id=parcel_locker_id, pickup_code_hash__in=candidates
+            ).exclude(status__in=cls.SLOT_RELEASING_STATUSES).values_list('pickup_code_hash', flat=True))
+            codes.update((code_hash, code) for code_hash, code in candidates.items() if code_hash not in in_use)
+        return list(codes.values())
+
+    @classmethod
+    def find_for_pickup(cls, parcel_locker_id, provided_code):
+        """
+        Paczka czekająca na odbiór w paczkomacie o podanym kodzie - jedno zapytanie po indeksie
+        (paczkomat, skrót kodu), z blokadą wiersza. None, gdy brak paczki lub kod nie jest jednoznaczny.
+        """
+        parcels = list(cls.objects.for_transition().filter(
+            parcel_locker_id=parcel_locker_id,
+            pickup_code_hash=hash_pickup_code(parcel_locker_id, provided_code),
+            status=cls.awaiting_pickup
+        )[:2])
+        return parcels[0] if len(parcels) == 1 else None
+
+    @classmethod
+    @transaction.atomic
+    @deferred_slot_counters()
+    def bulk_update_status(cls, updates):
+        """
+        Zmiana statusu wielu paczek naraz: lista par (numer przesyłki, nowy status).
+        Jedno zapytanie pobierające paczki (razem ze slotami), jeden bulk UPDATE paczek,
+        jeden UPDATE zwalnianych slotów i jeden bulk INSERT historii.
+        Zwraca wynik dla każdej pozycji, w kolejności wejściowej.
+        """
+        tracking_numbers = {tracking_number for tracking_number, _ in updates}
+        parcels = cls.objects.for_transition().in_bulk(tracking_numbers, field_name='tracking_number')
+
+        results = []
+        changed = {}
+        released = {}
+        history = []
+        for tracking_number, new_status in updates:
+            parcel = parcels.get(tracking_number)
+            if parcel is None:
+                results.append({'tracking_number': tracking_number, 'result': 'error', 'detail': 'Parcel not found.'})
+                continue
+            if new_status in cls.PICKUP_CODE_STATUSES:
+                results.append({
+                    'tracking_number': tracking_number,
+                    'result': 'error',
+                    'detail': 'Picking up a parcel requires its pickup code.'
+                })
+                continue
+            if not parcel.can_transition_to(new_status):
+                results.append({
+                    'tracking_number': tracking_number,
+                    'result': 'error',
+                    'detail': f"Cannot change status from '{parcel.status}' to '{new_status}'."
+                })
+                continue
+
+            slot = parcel.locker_slot
+            if new_status in cls.SLOT_RELEASING_STATUSES:
+                if slot is not None and slot.is_occupied:
+                    slot.is_occupied = False
+                    released[slot.pk] = slot
+            elif new_status == cls.awaiting_pickup and slot is None:
+                # Rzadki przypadek - paczka bez slotu; przydział pojedynczo
+                slot = LockerSlot.claim_free_slot(parcel.parcel_locker_id, parcel.size)
+                if slot is None:
+                    results.append({
+                        'tracking_number': tracking_number,
+                        'result': 'error',
+                        'detail': 'No available slots in the selected locker.'
+                    })
+                    continue
+                parcel.locker_slot = slot
+
+            parcel.status = new_status
+            changed[parcel.pk] = parcel
+            history.append(DeliveryHistory(parcel=parcel, event_type=DeliveryHistory.for_status(new_status)))
+            results.append({'tracking_number': tracking_number, 'result': 'updated', 'status': new_status})
+
+        cls._write_transitions(changed, released, history)
+        return results
+
+    @classmethod
+    @transaction.atomic
+    @deferred_slot_counters()
+    def bulk_pickup(cls, parcel_locker_id, events):
+        """
+        Odbiory zgłoszone wsadowo przez terminal paczkomatu: lista par (id paczki, kod odbioru).
+        Operacja idempotentna - ponownie przesłany odbiór paczki już odebranej jest zgłaszany
+        jako 'duplicate'. Zapis jak w bulk_update_status: jedno zapytanie pobierające paczki,
+        jeden bulk UPDATE paczek, jeden UPDATE slotów i jeden bulk INSERT historii.
+        """
+        parcels = cls.objects.for_transition().filter(parcel_locker_id=parcel_locker_id).in_bulk(
+            {parcel_id for parcel_id, _ in events}
         )
 
-        return True
+        results = []
+        changed = {}
+        released = {}
+        history = []
+        for parcel_id, provided_code in events:
+            parcel = parcels.get(parcel_id)
+            if parcel is None:
+                results.append({'parcel': parcel_id, 'result': 'error', 'detail': 'Parcel not found.'})
+                continue
+            if not pickup_code_matches(parcel.parcel_locker_id, provided_code, parcel.pickup_code_hash):
+                results.append({'parcel': parcel_id, 'result': 'error', 'detail': 'Invalid pickup code.'})
+                continue
+            if parcel.status == cls.picked_up:
+                results.append({'parcel': parcel_id, 'result': 'duplicate'})
+                continue
+            if parcel.status != cls.awaiting_pickup:
+                results.append({
+                    'parcel': parcel_id,
+                    'result': 'error',
+                    'detail': f"Cannot pick up a parcel with status '{parcel.status}'."
+                })
+                continue
+
+            slot = parcel.locker_slot
+            if slot is not None and slot.is_occupied:
+                slot.is_occupied = False
+                released[slot.pk] = slot
+            parcel.status = cls.picked_up
+            changed[parcel.pk] = parcel
+            history.append(DeliveryHistory(parcel=parcel, event_type=DeliveryHistory.for_status(cls.picked_up)))
+            results.append({'parcel': parcel_id, 'result': 'picked_up'})
+
+        cls._write_transitions(changed, released, history)
+        return results
+
+    @classmethod
+    def _write_transitions(cls, changed, released, history):
+        """Wsadowy zapis zmian statusu: paczki, zwolnione sloty (z licznikami) i wpisy historii"""
+        cls.objects.bulk_update(changed.values(), ['status', 'locker_slot'], batch_size=500)
+        if released:
+            # Liczniki zmieniamy tylko o sloty faktycznie zwolnione tym zapisem (jak release_slot),
+            # więc najpierw blokujemy i wybieramy te, które wciąż są zajęte
+            occupied = list(LockerSlot.objects.select_for_update().filter(
+                pk__in=released, is_occupied=True
+            ).values_list('pk', flat=True))
+            LockerSlot.objects.filter(pk__in=occupied).update(
+                is_occupied=False,
+                last_updated=timezone.now()
+            )
+            freed = Counter((released[pk].parcel_locker_id, released[pk].size) for pk in occupied)
+            for (locker_id, size), count in freed.items():
+                ParcelLocker.adjust_free_slots(locker_id, size, count)
+        DeliveryHistory.bulk_record(history)
+
+    @classmethod
+    @transaction.atomic
+    @deferred_slot_counters()
+    def bulk_send(cls, items, sender, allow_upsize=None):
+        """
+        Nadanie wielu paczek naraz. `items` to słowniki z polami tracking_number, parcel_locker (id),
+        size i receiver (id lub None). Paczki są grupowane po paczkomacie, sloty i kody odbioru
+        przydzielane jednym przebiegiem na paczkomat, a paczki i wpisy historii zapisywane wsadowo.
+        Zwraca (utworzone paczki, błędy) - błędy jako słowniki z indeksem pozycji i opisem.
+        """
+        errors = []
+        lockers = ParcelLocker.objects.in_bulk({item['parcel_locker'] for item in items})
+        receivers = User.objects.in_bulk({item['receiver'] for item in items if item.get('receiver')})
+        taken = set(cls.objects.filter(
+            tracking_number__in=[item['tracking_number'] for item in items]
+        ).values_list('tracking_number', flat=True))
+
+        by_locker = defaultdict(list)
+        for index, item in enumerate(items):
+            tracking_number = item['tracking_number']
+            if tracking_number in taken:
+                detail = "Tracking number already exists."
+            elif item['parcel_locker'] not in lockers:
+                detail = "Parcel locker not found."
+            elif item.get('receiver') and item['receiver'] not in receivers:
+                detail = "Receiver not found."
+            else:
+                taken.add(tracking_number)
+                by_locker[item['parcel_locker']].append(index)
+                continue
+            errors.append({'index': index, 'tracking_number': tracking_number, 'detail': detail})
+
+        parcels = []
+        for locker_id, indexes in by_locker.items():
+            sizes = [items[index].get('size', LockerSlot.MEDIUM) for index in indexes]
+            slots = LockerSlot.claim_free_slots(locker_id, sizes, allow_upsize)
+            codes = iter(cls.issue_pickup_codes(locker_id, sum(slot is not None for slot in slots)))
+            for index, size, slot in zip(indexes, sizes, slots):
+                item = items[index]
+                if slot is None:
+                    errors.append({
+                        'index': index,
+                        'tracking_number': item['tracking_number'],
+                        'detail': f"No available slots of size '{size}' in the selected locker."
+                    })
+                    continue
+                pickup_code = next(codes)
+                parcels.append(cls(
+                    tracking_number=item['tracking_number'],
+                    parcel_locker=lockers[locker_id],
+                    locker_slot=slot,
+                    size=size,
+                    status=cls.preparing,
+                    sender=sender,
+                    receiver=receivers.get(item.get('receiver')),
+                    pickup_code=pickup_code,
+                    pickup_code_hash=hash_pickup_code(locker_id, pickup_code),
+                ))
+
+        cls.objects.bulk_create(parcels, batch_size=500)
+        UserParcel.sync(parcels)
+        DeliveryHistory.bulk_record([
+            DeliveryHistory(parcel=parcel, event_type=DeliveryHistory.CREATED) for parcel in parcels
+        ])
+        errors.sort(key=lambda error: error['index'])
+        return parcels, errors
 
     def __str__(self):
         return f"Paczka {self.tracking_number}: {self.get_status_display()}"
 
 
+class UserParcel(models.Model):
+    """
+    Zdenormalizowana skrzynka użytkownika: jedna para (użytkownik, paczka) z rolą użytkownika.
+    Listy "moje paczki" i "moja historia" to dzięki temu jeden zakres indeksu zamiast OR po nadawcy/odbiorcy.
+    """
+    SENDER = 'sender'
+    RECEIVER = 'receiver'
+    BOTH = 'both'
+
+    ROLE_CHOICES = [
+        (SENDER, 'Sender'),
+        (RECEIVER, 'Receiver'),
+        (BOTH, 'Sender and receiver'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='parcel_memberships')
+    parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name='memberships')
+    role = models.CharField(max_length=8, choices=ROLE_CHOICES)
+    # Kopia Parcel.created_at, żeby skrzynka była posortowana w indeksie
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'parcel'], name='unique_user_parcel'),
+        ]
+        indexes = [
+            # Z parcel na końcu - strona skrzynki (created_at, id) malejąco prosto z indeksu
+            models.Index(fields=['user', 'created_at', 'parcel'], name='userparcel_user_created_idx'),
+        ]
+
+    @classmethod
+    def parcel_ids(cls, user):
+        """Podzapytanie z id paczek użytkownika - bez złączenia z tabelą paczek"""
+        return cls.objects.filter(user=user).values('parcel_id')
+
+    @classmethod
+    def for_parcel(cls, parcel):
+        roles = {}
+        if parcel.sender_id:
+            roles[parcel.sender_id] = cls.SENDER
+        if parcel.receiver_id:
+            roles[parcel.receiver_id] = cls.BOTH if parcel.receiver_id in roles else cls.RECEIVER
+        return [
+            cls(user_id=user_id, parcel=parcel, role=role, created_at=parcel.created_at)
+            for user_id, role in roles.items()
+        ]
+
+    @classmethod
+    def sync(cls, parcels, replace=False):
+        """Zapis wpisów skrzynek dla paczek jednym INSERT-em (replace - najpierw usuń stare)"""
+        if replace:
+            cls.objects.filter(parcel__in=parcels).delete()
+        return cls.objects.bulk_create(
+            [membership for parcel in parcels for membership in cls.for_parcel(parcel)],
+            batch_size=500
+        )
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.parcel_id} ({self.role})"
+
+
 class DeliveryHistory(models.Model):
     CREATED = 'created'
     PLACED_IN_LOCKER = 'placed_in_locker'
     PICKED_UP = 'picked_up'
+    IN_TRANSIT = 'in_transit'
+    DELIVERED = 'delivered'
 
     EVENT_TYPES = [
         (CREATED, 'Created'),
         (PLACED_IN_LOCKER, 'Placed in Locker'),
         (PICKED_UP, 'Picked Up'),
+        (IN_TRANSIT, 'In Transit'),
+        (DELIVERED, 'Delivered'),
     ]
 
+    # Zdarzenie zapisywane w historii po zmianie statusu paczki
+    STATUS_EVENTS = {
+        Parcel.in_transit: IN_TRANSIT,
+        Parcel.awaiting_pickup: PLACED_IN_LOCKER,
+        Parcel.picked_up: PICKED_UP,
+        Parcel.delivered: DELIVERED,
+    }
+
     id = models.AutoField(primary_key=True)
     parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name='history')
     event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
     event_time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['parcel', 'event_time'], name='history_parcel_time_idx'),
+        ]
+
+    @classmethod
+    def for_status(cls, status):
+        return cls.STATUS_EVENTS[status]
+
+    @classmethod
+    def bulk_record(cls, entries):
+        """Zapis wielu wpisów historii jednym INSERT-em (z powiadomieniem strumienia zdarzeń)"""
+        created = cls.objects.bulk_create(entries, batch_size=500)
+        for entry in created:
+            broker.publish_on_commit(history_event(entry))
+        return created
+
+    def save(self, *args, **kwargs):
+        # Historia jest tylko dopisywana - istniejących wpisów się nie zmienia
+        if not self._state.adding:
+            raise ValueError("Wpisy historii doręczeń nie mogą być modyfikowane.")
+        super().save(*args, **kwargs)
+        broker.publish_on_commit(history_event(self))
+
+    def __str__(self):
+        return f"{self.parcel.tracking_number}: {self.event_type} at {self.event_time}"
+
+
+class ArchivedDeliveryHistory(models.Model):
+    """
+    Archiwum starych wpisów historii doręczeń w kompaktowym schemacie: kod zdarzenia zamiast
+    tekstu i kolumna miesiąca (RRRRMM), po której archiwum jest dzielone na miesięczne partie.
+    Wpisy zachowują id z DeliveryHistory.
+    """
+    # Kody zapisane w archiwum - stałe, niezależne od kolejności DeliveryHistory.EVENT_TYPES.
+    # Nowe zdarzenia dostają kolejne wolne kody; istniejących nie wolno zmieniać.
+    EVENT_CODES = {
+        DeliveryHistory.CREATED: 1,
+        DeliveryHistory.PLACED_IN_LOCKER: 2,
+        DeliveryHistory.PICKED_UP: 3,
+        DeliveryHistory.IN_TRANSIT: 4,
+        DeliveryHistory.DELIVERED: 5,
+    }
+    EVENT_TYPES_BY_CODE = {code: event_type for event_type, code in EVENT_CODES.items()}
+
+    id = models.BigIntegerField(primary_key=True)
+    parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name='archived_history', db_index=False)
+    event = models.PositiveSmallIntegerField()
+    event_time = models.DateTimeField()
+    month = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parcel', 'event_time'], name='archive_parcel_time_idx'),
+            models.Index(fields=['month', 'id'], name='archive_month_idx'),
+        ]
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(
+            id=entry.id,
+            parcel_id=entry.parcel_id,
+            event=cls.EVENT_CODES[entry.event_type],
+            event_time=entry.event_time,
+            month=entry.event_time.year * 100 + entry.event_time.month,
+        )
+
+    @property
+    def event_type(self):
+        return self.EVENT_TYPES_BY_CODE[self.event]
+
+    def get_event_type_display(self):
+        return dict(DeliveryHistory.EVENT_TYPES)[self.event_type]
+
+    def __str__(self):
+        return f"{self.parcel_id}: {self.event_type} at {self.event_time} (archiwum)"
+
+
+class LockerKiosk(models.Model):
+    """
+    Konto terminala (kiosku) przypisane do jednego paczkomatu. Terminal dostaje klucz i skróty
+    kodów odbioru tylko swojego paczkomatu.
+    """
+    id = models.AutoField(primary_key=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='kiosk')
+    parcel_locker = models.ForeignKey(ParcelLocker, on_delete=models.CASCADE, related_name='kiosks')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def locker_id_of(user):
+        """Id paczkomatu, do którego przypisane jest konto (None dla innych kont)"""
+        kiosk = getattr(user, 'kiosk', None)
+        return kiosk.parcel_locker_id if kiosk else None
+
     def __str__(self):
-        return f"{self.parcel.tracking_number}: {self.event_type} at {self.event_time}"
\ No newline at end of file
+        return f"{self.user} -> {self.parcel_locker}"
@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination - every page is a single indexed range query,
+    so response time does not grow with the table size or the page number.
+    """
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+
+
+class ParcelCursorPagination(KeysetCursorPagination):
+    ordering = ('-created_at', '-id')
+    # The same order read from the user's inbox index (see ParcelQuerySet.visible_to)
+    inbox_ordering = ('-inbox_created_at', '-inbox_parcel_id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering == self.ordering and 'inbox_created_at' in queryset.query.annotations:
+            return self.inbox_ordering
+        return ordering
+
+
+class DeliveryHistoryCursorPagination(KeysetCursorPagination):
+    ordering = ('-event_time', '-id')
+
+
+class LockerSlotCursorPagination(KeysetCursorPagination):
+    ordering = ('id',)
@@ -0,0 +1,32 @@
+import hashlib
+import hmac
+import secrets
+
+from django.conf import settings
+
+# Hasła odbioru są przechowywane jako HMAC kluczem paczkomatu, wyprowadzonym z SECRET_KEY.
+# Zmiana SECRET_KEY unieważnia zapisane skróty - trzeba je wtedy przeliczyć (Parcel.save).
+
+PICKUP_CODE_DIGITS = 6
+
+
+def locker_key(locker_id):
+    """Secret key of one locker; a kiosk holding it can verify codes of its own locker only"""
+    return hmac.new(settings.SECRET_KEY.encode(), f"pickup-code-locker:{locker_id}".encode(), hashlib.sha256).digest()
+
+
+def new_pickup_code():
+    """Random numeric pickup code; uniqueness within a locker is checked by Parcel.issue_pickup_codes"""
+    return f"{secrets.randbelow(10 ** PICKUP_CODE_DIGITS):0{PICKUP_CODE_DIGITS}d}"
+
+
+def hash_pickup_code(locker_id, code):
+    """Hex HMAC-SHA256 of a pickup code under the locker's key ('' for a parcel without a locker)"""
+    if locker_id is None:
+        return ''
+    return hmac.new(locker_key(locker_id), str(code).encode(), hashlib.sha256).hexdigest()
+
+
+def pickup_code_matches(locker_id, code, stored_hash):
+    """Constant-time check of a provided pickup code against the stored hash"""
+    return bool(stored_hash) and hmac.compare_digest(hash_pickup_code(locker_id, code), stored_hash)
@@ -0,0 +1,117 @@
+"""
+Development/CI query checks: repeated SQL shapes within one request (N+1), slow queries and
+per-view query budgets. Views declare `query_budget` as a number, or as a dict per viewset
+action, e.g. `query_budget = {'list': 2, 'retrieve': 3}`.
+"""
+import logging
+import re
+import sys
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from rest_framework import serializers
+
+from . import db_hooks
+
+logger = logging.getLogger(__name__)
+
+RecordedQuery = namedtuple('RecordedQuery', 'shape duration field stack')
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"IN \((?:\?, )*\?\)")
+WHITESPACE = re.compile(r"\s+")
+# Transaction control depends on the backend and the atomic() nesting, not on the view's code
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+# Frames shown for a query: project code only, without the query hook modules
+PROJECT_DIR = str(settings.BASE_DIR)
+HOOK_FILES = {__file__, db_hooks.__file__}
+STACK_DEPTH = 5
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    """SQL shape: parameters and literals replaced by ?, IN lists of any length collapsed"""
+    sql = LITERALS.sub('?', sql.replace('%s', '?'))
+    return IN_LIST.sub('IN (...)', WHITESPACE.sub(' ', sql)).strip()
+
+
+def serializer_field(frame):
+    """`Serializer.field` being rendered when the query ran, if any"""
+    while frame is not None:
+        if frame.f_code.co_name == 'to_representation':
+            owner, field = frame.f_locals.get('self'), frame.f_locals.get('field')
+            if isinstance(owner, serializers.Serializer) and field is not None:
+                return f"{type(owner).__name__}.{field.field_name}"
+        frame = frame.f_back
+    return None
+
+
+def project_stack(frame):
+    lines = []
+    while frame is not None and len(lines) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and filename not in HOOK_FILES and 'site-packages' not in filename:
+            lines.append(f"  {filename}:{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+    return lines
+
+
+class QueryLog:
+    """Query hook (see db_hooks.query_hook) recording the shape, time and origin of every query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            frame = sys._getframe(1)
+            self.queries.append(RecordedQuery(normalize_sql(sql), duration, serializer_field(frame), project_stack(frame)))
+
+    def repeated(self, threshold):
+        """{shape: queries} for shapes run at least `threshold` times"""
+        by_shape = {}
+        for query in self.queries:
+            by_shape.setdefault(query.shape, []).append(query)
+        return {shape: queries for shape, queries in by_shape.items() if len(queries) >= threshold}
+
+    def slow(self, threshold_ms):
+        return [query for query in self.queries if query.duration * 1000 >= threshold_ms]
+
+
+def view_query_budget(view_func, method):
+    """`query_budget` of a view (or of the viewset action handling `method`), None if undeclared"""
+    view = getattr(view_func, 'cls', view_func)
+    budget = getattr(view, 'query_budget', None)
+    if isinstance(budget, dict):
+        action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+        budget = budget.get(action)
+    return budget
+
+
+def check_queries(view, log, budget, options):
+    for shape, queries in log.repeated(options['N_PLUS_ONE_THRESHOLD']).items():
+        first = queries[0]
+        logger.warning(
+            "Possible N+1 in %s: %d x %s (serializer field: %s)\n%s",
+            view, len(queries), shape, first.field or 'none', "\n".join(first.stack)
+        )
+    for query in log.slow(options['SLOW_QUERY_MS']):
+        logger.warning("Slow query in %s (%.1f ms): %s\n%s", view, query.duration * 1000, query.shape, "\n".join(query.stack))
+
+    if budget is not None and len(log.queries) > budget:
+        message = f"{view} ran {len(log.queries)} queries, its budget is {budget}"
+        if options['STRICT']:
+            shapes = "\n".join(f"  {len(queries)} x {shape}" for shape, queries in log.repeated(1).items())
+            raise QueryBudgetExceeded(f"{message}:\n{shapes}")
+        logger.error(message)
@@ -0,0 +1,64 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional
+    msgpack = None
+
+
+def to_columns(rows):
+    """
+    Turn a list of flat-or-nested dicts into parallel arrays, one per (flattened) key:
+    [{'id': 1, 'available_slots': {'small': 2}}] -> {'id': [1], 'available_slots_small': [2]}
+    """
+    columns = {}
+    for index, row in enumerate(rows):
+        for key, value in _flatten(row):
+            columns.setdefault(key, [None] * index).append(value)
+        for column in columns.values():
+            if len(column) <= index:
+                column.append(None)
+    return columns
+
+
+def _flatten(row, prefix=''):
+    for key, value in row.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def columnar(data):
+    return to_columns(data) if isinstance(data, list) else data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON with parallel arrays per field instead of one object per row"""
+    media_type = 'application/vnd.paczkomaty.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Columnar layout encoded as MessagePack (needs the optional `msgpack` package)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(columnar(data), use_bin_type=True)
+
+
+def compact_renderer_classes():
+    """Default renderers plus the compact ones available in this environment"""
+    renderers = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ColumnarJSONRenderer]
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
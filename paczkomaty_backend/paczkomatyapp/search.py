@@ -0,0 +1,118 @@
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import Parcel, ParcelLocker
+
+
+class ContainsSearchBackend:
+    """Plain case-insensitive substring search (full table scan without a trigram index)"""
+
+    def contains(self, model, fields, term):
+        return reduce(operator.or_, (Q(**{f"{field}__icontains": term}) for field in fields))
+
+    def filter(self, queryset, fields, term):
+        return queryset.filter(self.contains(queryset.model, fields, term))
+
+
+class PostgresTrigramSearchBackend(ContainsSearchBackend):
+    """
+    On PostgreSQL `icontains` compiles to UPPER(column) LIKE UPPER('%term%'), which the
+    pg_trgm GIN indexes created by the search migration serve directly.
+    """
+
+
+class SQLiteFTSSearchBackend(ContainsSearchBackend):
+    """Substring search through FTS5 tables with the trigram tokenizer (kept in sync by triggers)"""
+
+    # Tabela FTS i kolumny, które indeksuje
+    FTS_TABLES = {
+        Parcel: ('paczkomatyapp_parcel_fts', ('tracking_number',)),
+        ParcelLocker: ('paczkomatyapp_parcellocker_fts', ('name', 'location')),
+    }
+
+    # Tokenizer trigram dopasowuje tylko frazy o długości co najmniej 3 znaków
+    MIN_TERM_LENGTH = 3
+
+    def contains(self, model, fields, term):
+        table, indexed = self.FTS_TABLES.get(model, (None, ()))
+        fts_fields = [field for field in fields if field in indexed]
+        if not fts_fields or len(term) < self.MIN_TERM_LENGTH:
+            return super().contains(model, fields, term)
+
+        phrase = '"' + term.replace('"', '""') + '"'
+        match = f"{{{' '.join(fts_fields)}}} : {phrase}"
+        lookup = Q(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match]))
+
+        other_fields = [field for field in fields if field not in indexed]
+        if other_fields:
+            lookup |= super().contains(model, other_fields, term)
+        return lookup
+
+
+def ensure_sqlite_fts(connection):
+    """
+    Recreate missing FTS5 sync triggers and reindex the affected tables. SQLite migrations that
+    rebuild a table (e.g. adding a column) silently drop the triggers defined on it.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for model, (fts, columns) in SQLiteFTSSearchBackend.FTS_TABLES.items():
+            triggers = {f"{fts}_ai", f"{fts}_ad", f"{fts}_au"}
+            if fts not in existing or triggers <= existing:
+                # Tabela FTS nie została jeszcze utworzona przez migrację albo wszystko jest na miejscu
+                continue
+            source = model._meta.db_table
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f"new.{column}" for column in columns)
+            old_values = ', '.join(f"old.{column}" for column in columns)
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def get_search_backend():
+    """Backend from the SEARCH_BACKEND setting, otherwise the best one for the database in use"""
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresTrigramSearchBackend()
+    return ContainsSearchBackend()
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """DRF SearchFilter (same `search` parameter) that delegates matching to the search backend"""
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        backend = get_search_backend()
+        for term in search_terms:
+            queryset = backend.filter(queryset, search_fields, term)
+        return queryset
@@ -42,14 +42,17 @@ class ParcelLockerSerializer(serializers.ModelSerializer):
                   'available_slots_count', 'available_slots_by_size')
 
     def get_available_slots_count(self, obj):
-        return obj.slots.filter(is_occupied=False).count()
+        return obj.available_slots_count
 
     def get_available_slots_by_size(self, obj):
-        return {
-            'small': obj.slots.filter(size=LockerSlot.SMALL, is_occupied=False).count(),
-            'medium': obj.slots.filter(size=LockerSlot.MEDIUM, is_occupied=False).count(),
-            'large': obj.slots.filter(size=LockerSlot.LARGE, is_occupied=False).count()
-        }
+        return obj.available_slots_by_size
+
+
+class ParcelLockerImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ParcelLocker
+        fields = ('name', 'location', 'latitude', 'longitude', 'status',
+                  'small_slots', 'medium_slots', 'large_slots')
 
 
 class ParcelLockerDetailSerializer(serializers.ModelSerializer):
@@ -62,7 +65,7 @@ class ParcelLockerDetailSerializer(serializers.ModelSerializer):
                   'number_of_slots', 'created_at', 'slots', 'available_slots_count')
 
     def get_available_slots_count(self, obj):
-        return obj.slots.filter(is_occupied=False).count()
+        return obj.available_slots_count
 
 
 class DeliveryHistorySerializer(serializers.ModelSerializer):
@@ -84,10 +87,11 @@ class ParcelSerializer(serializers.ModelSerializer):
         model = Parcel
         fields = ('id', 'tracking_number', 'parcel_locker', 'parcel_locker_name',
                   'locker_slot', 'locker_slot_info', 'size', 'status', 'status_display',
-                  'sender', 'sender_username', 'receiver', 'receiver_username',
-                  'pickup_code', 'created_at')
-        read_only_fields = ('locker_slot',)  # locker_slot is assigned automatically
-        extra_kwargs = {'pickup_code': {'write_only': True}}  # Hide pickup code for security
+                  'sender', 'sender_username', 'receiver', 'receiver_username', 'created_at')
+        # locker_slot is assigned automatically; status changes only through the transition
+        # endpoints (update_status, pickup), which keep slots, counters and history in step.
+        # The pickup code is generated by Parcel.save and given to the receiver by get_pickup_code.
+        read_only_fields = ('locker_slot', 'status')
 
     def validate(self, data):
         # Validate that the size is one of the allowed choices
@@ -100,13 +104,8 @@ class ParcelSerializer(serializers.ModelSerializer):
             size = data.get('size', LockerSlot.MEDIUM)
 
             if parcel_locker:
-                available_slot = LockerSlot.objects.filter(
-                    parcel_locker=parcel_locker,
-                    size=size,
-                    is_occupied=False
-                ).first()
-
-                if not available_slot:
+                free_slots = parcel_locker.available_slots_by_size
+                if not any(free_slots.get(candidate) for candidate in LockerSlot.allocation_sizes(size)):
                     raise serializers.ValidationError(
                         f"No available slots of size '{size}' in the selected locker."
                     )
@@ -121,6 +120,42 @@ class ParcelDetailSerializer(ParcelSerializer):
         fields = ParcelSerializer.Meta.fields + ('history',)
 
 
+class BulkParcelItemSerializer(serializers.Serializer):
+    # Plain ids instead of PrimaryKeyRelatedField: existence is checked in bulk by Parcel.bulk_send
+    tracking_number = serializers.CharField(max_length=30)
+    parcel_locker = serializers.IntegerField()
+    size = serializers.ChoiceField(choices=LockerSlot.SIZE_CHOICES, default=LockerSlot.MEDIUM)
+    receiver = serializers.IntegerField(required=False, allow_null=True)
+
+
+class BulkParcelCreateSerializer(serializers.Serializer):
+    parcels = BulkParcelItemSerializer(many=True, allow_empty=False, max_length=5000)
+
+
+class ParcelStatusUpdateSerializer(serializers.Serializer):
+    tracking_number = serializers.CharField(max_length=30)
+    status = serializers.ChoiceField(choices=Parcel.status_choices)
+
+
+class BulkParcelStatusUpdateSerializer(serializers.Serializer):
+    updates = ParcelStatusUpdateSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class KioskPickupSerializer(serializers.Serializer):
+    parcel_locker = serializers.IntegerField()
+    pickup_code = serializers.CharField(max_length=30)
+
+
+class KioskSyncEventSerializer(serializers.Serializer):
+    parcel = serializers.IntegerField()
+    pickup_code = serializers.CharField(max_length=30)
+
+
+class KioskSyncSerializer(serializers.Serializer):
+    parcel_locker = serializers.IntegerField()
+    events = KioskSyncEventSerializer(many=True, allow_empty=False, max_length=1000)
+
+
 class ParcelPickupSerializer(serializers.Serializer):
     pickup_code = serializers.CharField(max_length=30)
 
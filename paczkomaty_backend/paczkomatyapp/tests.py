@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import async_views
+from .async_views import format_sse, is_visible
+from .authentication import TokenUserCache, token_user_cache
+from .events import availability_delta_event, broker
+from .geo import grid_cell
+from .importers import import_lockers
+from .metrics import HISTOGRAMS
+from .pagination import ParcelCursorPagination
+from .pickup_codes import hash_pickup_code, locker_key
+from .query_detector import QueryBudgetExceeded, QueryLog, normalize_sql
+from .serializers import ParcelSerializer
+from .views import ParcelViewSet, PublicParcelLockerMapView
+from .models import deferred_slot_counters, ArchivedDeliveryHistory, LockerKiosk, DeliveryHistory, ParcelLocker, LockerSlot, Parcel, UserParcel
+from .renderers import to_columns
+
+
+def create_locker(name='Locker', **kwargs):
+    return ParcelLocker.objects.create(
+        name=name,
+        location='Lublin',
+        latitude='51.2465',
+        longitude='22.5684',
+        **kwargs
+    )
+
+
+class PublicParcelLockerListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_reports_free_slots_by_size(self):
+        locker = create_locker(small_slots=2, medium_slots=1, large_slots=1)
+        LockerSlot.objects.filter(parcel_locker=locker, slot_number='S1').update(is_occupied=True)
+        locker.refresh_free_slots()
+
+        response = self.client.get('/api/public_parcel_lockers/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['available_slots'], {'small': 1, 'medium': 1, 'large': 1})
+
+    def test_query_count_does_not_depend_on_locker_count(self):
+        create_locker()
+        with self.assertNumQueries(1):
+            self.client.get('/api/public_parcel_lockers/')
+
+        for i in range(5):
+            create_locker(name=f'Locker {i}')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/public_parcel_lockers/')
+        self.assertEqual(len(response.data), 6)
+
+
+class FreeSlotCounterTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender', password='secret-pass')
+        self.locker = create_locker(small_slots=2, medium_slots=2, large_slots=1)
+
+    def test_new_locker_starts_with_all_slots_free(self):
+        self.assertEqual(self.locker.available_slots_by_size, {'small': 2, 'medium': 2, 'large': 1})
+
+    def test_counters_follow_allocation_and_pickup(self):
+        parcel = Parcel.objects.create(
+            tracking_number='PL001', parcel_locker=self.locker, size=LockerSlot.SMALL,
+            sender=self.sender, pickup_code='1234', status=Parcel.awaiting_pickup
+        )
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_small_slots, 1)
+
+        parcel.pickup('1234')
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_small_slots, 2)
+
+    def test_reconcile_command_fixes_drifted_counters(self):
+        ParcelLocker.objects.filter(pk=self.locker.pk).update(free_medium_slots=7)
+
+        call_command('reconcile_slot_counters', stdout=StringIO())
+
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_medium_slots, 2)
+
+
+class LockerProvisioningTests(TestCase):
+    def test_new_locker_creates_all_slots(self):
+        locker = create_locker(small_slots=3, medium_slots=2, large_slots=1)
+
+        self.assertEqual(
+            sorted(locker.slots.values_list('slot_number', flat=True)),
+            ['L1', 'M1', 'M2', 'S1', 'S2', 'S3']
+        )
+
+    def test_bulk_import_endpoint_provisions_lockers_and_slots(self):
+        admin = User.objects.create_superuser('admin', password='secret-pass')
+        client = APIClient()
+        client.force_authenticate(admin)
+        rows = [
+            {'name': f'Import {i}', 'location': 'Lublin', 'latitude': '51.2', 'longitude': '22.5',
+             'small_slots': 1, 'medium_slots': 1, 'large_slots': 1}
+            for i in range(3)
+        ]
+
+        response = client.post('/api/parcel_lockers/bulk_import/', rows, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ParcelLocker.objects.count(), 3)
+        self.assertEqual(LockerSlot.objects.count(), 9)
+        self.assertTrue(all(locker.available_slots_count == 3 for locker in ParcelLocker.objects.all()))
+
+    def test_bulk_import_rejects_invalid_rows(self):
+        rows = [{'name': 'Broken', 'location': 'Lublin'}]
+
+        created, errors = import_lockers(rows)
+
+        self.assertEqual(created, 0)
+        self.assertIn(0, errors)
+        self.assertFalse(ParcelLocker.objects.exists())
+
+
+class SlotAllocationTests(TestCase):
+    def setUp(self):
+        self.locker = create_locker(small_slots=1, medium_slots=1, large_slots=1)
+
+    def test_claims_slot_of_requested_size(self):
+        slot = LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.MEDIUM)
+
+        self.assertEqual(slot.size, LockerSlot.MEDIUM)
+        self.assertTrue(LockerSlot.objects.get(pk=slot.pk).is_occupied)
+        self.assertIsNone(LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.MEDIUM))
+
+    def test_upsize_falls_back_to_larger_slot(self):
+        LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.MEDIUM)
+
+        slot = LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.MEDIUM, allow_upsize=True)
+
+        self.assertEqual(slot.size, LockerSlot.LARGE)
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.available_slots_by_size, {'small': 1, 'medium': 0, 'large': 0})
+
+    def test_counters_are_written_last_in_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            Parcel.objects.create(tracking_number='PL0', parcel_locker=self.locker, pickup_code='1')
+
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+        # The shared locker row is locked by the last statement only
+        self.assertTrue(writes[-1].startswith('UPDATE "paczkomatyapp_parcellocker"'))
+        self.assertEqual(sum(sql.startswith('UPDATE "paczkomatyapp_parcellocker"') for sql in writes), 1)
+
+    def test_rolled_back_block_leaves_counters_alone(self):
+        with deferred_slot_counters():
+            with self.assertRaises(ValidationError):
+                with transaction.atomic(), deferred_slot_counters():
+                    LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.MEDIUM)
+                    raise ValidationError("rollback")
+            LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.SMALL)
+
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.available_slots_by_size, {'small': 0, 'medium': 1, 'large': 1})
+
+    @override_settings(PARCEL_SLOT_UPSIZE=True)
+    def test_upsize_policy_from_settings(self):
+        self.assertEqual(LockerSlot.allocation_sizes(LockerSlot.SMALL), ['small', 'medium', 'large'])
+        self.assertEqual(LockerSlot.allocation_sizes(LockerSlot.LARGE), ['large'])
+
+
+class ConcurrentSlotAllocationTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+
+    def test_concurrent_claims_never_share_a_slot(self):
+        locker = create_locker(small_slots=0, medium_slots=50, large_slots=0)
+        claimed = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    slot = LockerSlot.claim_free_slot(locker.pk, LockerSlot.MEDIUM)
+                    if slot:
+                        with lock:
+                            claimed.append(slot.pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claimed), 50)
+        self.assertEqual(len(set(claimed)), 50)
+        locker.refresh_from_db()
+        self.assertEqual(locker.free_medium_slots, 0)
+
+    @skipIf(connection.features.has_select_for_update_skip_locked, "compare-and-set path only")
+    def test_lost_compare_and_set_moves_to_the_next_candidate(self):
+        locker = create_locker(small_slots=0, medium_slots=2, large_slots=0)
+        first, second = LockerSlot.objects.filter(parcel_locker=locker).order_by('id')
+        raced = []
+
+        def concurrent_claim(execute, sql, params, many, context):
+            # Another allocator takes the first candidate between the SELECT and our UPDATE
+            if sql.startswith('UPDATE "paczkomatyapp_lockerslot"') and not raced:
+                raced.append(True)
+                execute('UPDATE "paczkomatyapp_lockerslot" SET "is_occupied" = %s WHERE "id" = %s',
+                        (True, first.pk), False, context)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_claim):
+            slot = LockerSlot.claim_free_slot(locker.pk, LockerSlot.MEDIUM)
+
+        self.assertEqual(slot.pk, second.pk)
+        locker.refresh_from_db()
+        # Only our claim went through claim_free_slot; the concurrent one bypassed the counter
+        self.assertEqual(locker.free_medium_slots, 1)
+
+
+class ListEndpointQueryCountTests(TestCase):
+    """List endpoints must issue the same number of queries no matter how many rows they return"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='secret-pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.created = 0
+
+    def add_parcels(self, count):
+        for _ in range(count):
+            self.created += 1
+            locker = create_locker(name=f'Locker {self.created}', small_slots=1, medium_slots=1, large_slots=1)
+            receiver = User.objects.create_user(f'receiver{self.created}')
+            Parcel.objects.create(
+                tracking_number=f'PL{self.created:05d}', parcel_locker=locker,
+                sender=self.admin, receiver=receiver, pickup_code='1234'
+            )
+
+    def assertConstantQueries(self, url):
+        self.add_parcels(1)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.add_parcels(5)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual(
+            len(few), len(many),
+            "Query count grows with the number of rows:\n" + "\n".join(q['sql'] for q in many.captured_queries)
+        )
+
+    def test_users_list(self):
+        self.assertConstantQueries('/api/users/')
+
+    def test_user_parcels(self):
+        self.assertConstantQueries(f'/api/users/{self.admin.pk}/parcels/')
+
+    def test_parcel_lockers_list(self):
+        self.assertConstantQueries('/api/parcel_lockers/')
+
+    def test_locker_slots_list(self):
+        self.assertConstantQueries('/api/locker_slots/')
+
+    def test_parcels_list(self):
+        self.assertConstantQueries('/api/parcels/')
+
+    def test_delivery_history_list(self):
+        self.assertConstantQueries('/api/delivery_history/')
+
+    def test_public_parcel_lockers_list(self):
+        self.assertConstantQueries('/api/public_parcel_lockers/')
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sender')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        locker = create_locker(small_slots=0, medium_slots=5, large_slots=0)
+        for i in range(5):
+            Parcel.objects.create(
+                tracking_number=f'PL{i}', parcel_locker=locker, sender=self.user, pickup_code='1234'
+            )
+
+    def test_parcels_are_paged_newest_first(self):
+        seen = []
+        url = '/api/parcels/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(parcel['tracking_number'] for parcel in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, ['PL4', 'PL3', 'PL2', 'PL1', 'PL0'])
+
+    def test_user_parcels_pages_each_list_separately(self):
+        response = self.client.get(f'/api/users/{self.user.pk}/parcels/?page_size=3')
+
+        self.assertEqual(len(response.data['sent_parcels']['results']), 3)
+        self.assertIn('sent_cursor=', response.data['sent_parcels']['next'])
+        self.assertEqual(response.data['received_parcels']['results'], [])
+
+
+class SearchBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sender')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.locker = create_locker(name='Centrum', medium_slots=3)
+        create_locker(name='Czechów')
+        for tracking_number in ('PL1234567', 'PL7654321', 'DE0001234'):
+            Parcel.objects.create(
+                tracking_number=tracking_number, parcel_locker=self.locker,
+                sender=self.user, pickup_code='1234'
+            )
+
+    def tracking_numbers(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sorted(parcel['tracking_number'] for parcel in response.data['results'])
+
+    def test_tracking_substring_search(self):
+        self.assertEqual(self.tracking_numbers('/api/parcels/?tracking=1234'), ['DE0001234', 'PL1234567'])
+        self.assertEqual(self.tracking_numbers('/api/parcels/?search=pl76'), ['PL7654321'])
+
+    def test_search_uses_the_index_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.tracking_numbers('/api/parcels/?search=preparing'), [])
+
+        sql = next(q['sql'] for q in queries if 'paczkomatyapp_parcel_fts' in q['sql'])
+        self.assertNotIn('LIKE', sql)
+        self.assertEqual(len(self.tracking_numbers('/api/parcels/?status=preparing')), 3)
+
+    def test_short_terms_fall_back_to_substring_scan(self):
+        self.assertEqual(self.tracking_numbers('/api/parcels/?tracking=DE'), ['DE0001234'])
+
+    def test_index_follows_updates(self):
+        Parcel.objects.filter(tracking_number='DE0001234').update(tracking_number='CZ999')
+
+        self.assertEqual(self.tracking_numbers('/api/parcels/?tracking=0001'), [])
+        self.assertEqual(self.tracking_numbers('/api/parcels/?tracking=z99'), ['CZ999'])
+
+    def test_locker_search(self):
+        response = self.client.get('/api/parcel_lockers/?search=entr')
+
+        self.assertEqual([locker['name'] for locker in response.data], ['Centrum'])
+
+
+class NearbyLockersTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('user'))
+        # Lublin city centre and two lockers at roughly 1 km and 3 km, one 150 km away (Warsaw)
+        self.near = ParcelLocker.objects.create(
+            name='Near', location='Lublin', latitude='51.2560', longitude='22.5684', large_slots=0
+        )
+        self.farther = ParcelLocker.objects.create(
+            name='Farther', location='Lublin', latitude='51.2735', longitude='22.5684'
+        )
+        ParcelLocker.objects.create(name='Warsaw', location='Warszawa', latitude='52.2297', longitude='21.0122')
+
+    def test_returns_lockers_in_radius_sorted_by_distance(self):
+        response = self.client.get('/api/parcel_lockers/nearby/?lat=51.2465&lng=22.5684&radius=10')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([locker['name'] for locker in response.data], ['Near', 'Farther'])
+        self.assertAlmostEqual(response.data[0]['distance_km'], 1.056, places=2)
+
+    def test_filters_by_free_slot_size_and_limit(self):
+        response = self.client.get('/api/parcel_lockers/nearby/?lat=51.2465&lng=22.5684&size=large')
+        self.assertEqual([locker['name'] for locker in response.data], ['Farther'])
+
+        response = self.client.get('/api/parcel_lockers/nearby/?lat=51.2465&lng=22.5684&limit=1')
+        self.assertEqual([locker['name'] for locker in response.data], ['Near'])
+
+    def test_rejects_missing_coordinates(self):
+        response = self.client.get('/api/parcel_lockers/nearby/?lat=51.2')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_migration_backfills_grid_cells(self):
+        ParcelLocker.objects.update(grid_lat=0, grid_lng=0)
+        migration = importlib.import_module('paczkomatyapp.migrations.0015_parcellocker_grid_cell')
+
+        migration.populate_grid_cells(apps, None)
+
+        self.near.refresh_from_db()
+        self.assertEqual((self.near.grid_lat, self.near.grid_lng), (grid_cell(51.2560), grid_cell(22.5684)))
+
+    def test_rejects_non_finite_numbers(self):
+        for query in ('lat=51.2&lng=22.5&radius=nan', 'lat=51.2&lng=22.5&radius=inf', 'lat=nan&lng=22.5'):
+            response = self.client.get(f'/api/parcel_lockers/nearby/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class PublicParcelLockerMapViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i, (lat, lng) in enumerate([('51.2465', '22.5684'), ('51.2470', '22.5690'), ('52.2297', '21.0122')]):
+            ParcelLocker.objects.create(
+                name=f'Locker {i}', location='PL', latitude=lat, longitude=lng,
+                small_slots=1, medium_slots=1, large_slots=1
+            )
+
+    def test_clusters_lockers_at_low_zoom(self):
+        response = self.client.get('/api/public_parcel_lockers/map/?bbox=14,49,24,55&zoom=6')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['clustered'])
+        clusters = sorted(response.data['clusters'], key=lambda cluster: cluster['count'])
+        self.assertEqual([cluster['count'] for cluster in clusters], [1, 2])
+        self.assertEqual(clusters[1]['available_slots'], {'small': 2, 'medium': 2, 'large': 2})
+
+    def test_returns_single_lockers_in_viewport_at_high_zoom(self):
+        response = self.client.get('/api/public_parcel_lockers/map/?bbox=22.56,51.24,22.58,51.25&zoom=16')
+
+        self.assertFalse(response.data['clustered'])
+        self.assertFalse(response.data['truncated'])
+        self.assertEqual([locker['name'] for locker in response.data['lockers']], ['Locker 0', 'Locker 1'])
+
+    def test_flags_truncated_locker_list(self):
+        with mock.patch.object(PublicParcelLockerMapView, 'MAX_LOCKERS', 1):
+            response = self.client.get('/api/public_parcel_lockers/map/?bbox=22.56,51.24,22.58,51.25&zoom=16')
+
+        self.assertTrue(response.data['truncated'])
+        self.assertEqual([locker['name'] for locker in response.data['lockers']], ['Locker 0'])
+
+    @skipUnless(connection.vendor == 'sqlite', "SQLite query plan")
+    def test_viewport_uses_the_grid_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/public_parcel_lockers/map/?bbox=22.56,51.24,22.58,51.25&zoom=16')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn('parcellocker_grid_idx', plan)
+
+    def test_requires_bbox(self):
+        self.assertEqual(self.client.get('/api/public_parcel_lockers/map/?zoom=5').status_code, 400)
+
+    def test_rejects_non_finite_or_out_of_range_bbox(self):
+        for bbox in ('nan,51,23,52', 'inf,51,inf,52', '22,51,23,nan', '-200,51,23,52', '22,-91,23,52'):
+            response = self.client.get(f'/api/public_parcel_lockers/map/?bbox={bbox}&zoom=16')
+            self.assertEqual(response.status_code, 400, bbox)
+
+
+class LockerCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.locker = create_locker(small_slots=1, medium_slots=1, large_slots=1)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.client.get('/api/public_parcel_lockers/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/public_parcel_lockers/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_slot_occupancy_change_invalidates_cache(self):
+        self.client.get('/api/public_parcel_lockers/')
+
+        LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.SMALL)
+
+        response = self.client.get('/api/public_parcel_lockers/')
+        self.assertEqual(response.data[0]['available_slots']['small'], 0)
+
+    def test_unchanged_data_returns_not_modified(self):
+        etag = self.client.get('/api/public_parcel_lockers/')['ETag']
+
+        response = self.client.get('/api/public_parcel_lockers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        LockerSlot.claim_free_slot(self.locker.pk, LockerSlot.SMALL)
+        response = self.client.get('/api/public_parcel_lockers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CompactLockerPayloadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(20):
+            create_locker(name=f'Locker {i}', small_slots=1, medium_slots=0, large_slots=0)
+
+    def test_columnar_format_returns_parallel_arrays(self):
+        response = self.client.get('/api/public_parcel_lockers/', HTTP_ACCEPT='application/vnd.paczkomaty.columnar+json')
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.paczkomaty.columnar+json')
+        columns = json.loads(response.content)
+        self.assertEqual(len(columns['id']), 20)
+        self.assertEqual(columns['available_slots_small'], [1] * 20)
+        self.assertEqual(columns['available_slots_large'], [0] * 20)
+
+    def test_to_columns_pads_missing_keys(self):
+        self.assertEqual(
+            to_columns([{'a': 1}, {'a': 2, 'b': {'c': 3}}]),
+            {'a': [1, 2], 'b_c': [None, 3]}
+        )
+
+    def test_responses_are_gzip_compressed(self):
+        response = self.client.get('/api/public_parcel_lockers/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 20)
+
+
+class ParcelEventsTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender')
+        self.other = User.objects.create_user('other')
+        self.locker = create_locker(small_slots=0, medium_slots=1, large_slots=0)
+
+    def test_parcel_changes_are_published_after_commit(self):
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                Parcel.objects.create(
+                    tracking_number='PL1', parcel_locker=self.locker, sender=self.sender, pickup_code='1234'
+                )
+
+        events = [call.args[0] for call in publish.call_args_list]
+        self.assertIn(availability_delta_event(self.locker.pk, LockerSlot.MEDIUM, -1), events)
+        history = next(event for event in events if event['type'] == 'history')
+        self.assertEqual((history['tracking_number'], history['event_type']), ('PL1', 'created'))
+        self.assertTrue(is_visible(history, self.sender, None))
+        self.assertFalse(is_visible(history, self.other, None))
+        self.assertNotIn('user_ids', format_sse(history))
+
+    def test_broker_delivers_events_published_from_other_threads(self):
+        async def receive():
+            subscription = broker.subscribe()
+            try:
+                threading.Thread(target=broker.publish, args=({'type': 'availability', 'locker': 1},)).start()
+                return await asyncio.wait_for(subscription.get(), 1)
+            finally:
+                broker.unsubscribe(subscription)
+
+        self.assertEqual(asyncio.run(receive()), {'type': 'availability', 'locker': 1})
+
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get('/api/events/')
+
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncReadViewsTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender')
+        self.other = User.objects.create_user('other')
+        locker = create_locker(small_slots=0, medium_slots=3, large_slots=0)
+        self.parcels = [
+            Parcel.objects.create(
+                tracking_number=f'PL{i}', parcel_locker=locker, sender=self.sender, pickup_code='1234'
+            )
+            for i in range(3)
+        ]
+
+    def login(self, user):
+        self.async_client.cookies['authToken'] = str(AccessToken.for_user(user))
+
+    async def test_parcel_list_is_keyset_paginated(self):
+        self.login(self.sender)
+        seen = []
+        url = '/api/async/parcels/?page_size=2'
+        while url:
+            data = (await self.async_client.get(url)).json()
+            seen.extend(parcel['tracking_number'] for parcel in data['results'])
+            url = data['next']
+
+        self.assertEqual(seen, ['PL2', 'PL1', 'PL0'])
+
+    async def test_parcel_detail_is_limited_to_own_parcels(self):
+        self.login(self.sender)
+        response = await self.async_client.get(f'/api/async/parcels/{self.parcels[0].pk}/')
+        self.assertEqual(response.json()['history'][0]['event_type'], 'created')
+
+        self.login(self.other)
+        response = await self.async_client.get(f'/api/async/parcels/{self.parcels[0].pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_public_lockers_match_sync_view(self):
+        async_data = (await self.async_client.get('/api/async/public_parcel_lockers/')).json()
+        sync_data = (await sync_to_async(self.client.get)('/api/public_parcel_lockers/')).json()
+
+        self.assertEqual(async_data, sync_data)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/api/async/parcels/')
+
+        self.assertEqual(response.status_code, 401)
+
+
+class BulkParcelStatusUpdateTests(TestCase):
+    def setUp(self):
+        self.courier = User.objects.create_user('courier')
+        self.courier.user_permissions.add(Permission.objects.get(codename='update_parcel_status'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier)
+        locker = create_locker(small_slots=0, medium_slots=5, large_slots=0)
+        for i in range(3):
+            Parcel.objects.create(tracking_number=f'PL{i}', parcel_locker=locker, sender=self.courier, pickup_code='1')
+
+    def test_updates_valid_items_and_reports_the_rest(self):
+        updates = [
+            {'tracking_number': 'PL0', 'status': 'in_transit'},
+            {'tracking_number': 'PL1', 'status': 'delivered'},
+            {'tracking_number': 'PL2', 'status': 'in_transit'},
+            {'tracking_number': 'NOPE', 'status': 'in_transit'},
+        ]
+
+        # 2 of them load the courier's permissions
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/update_status/bulk/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(
+            [result['result'] for result in response.data['results']],
+            ['updated', 'error', 'updated', 'error']
+        )
+        self.assertEqual(Parcel.objects.get(tracking_number='PL1').status, Parcel.preparing)
+        self.assertEqual(
+            list(Parcel.objects.get(tracking_number='PL0').history.values_list('event_type', flat=True)),
+            ['created', 'in_transit']
+        )
+
+    def test_repeated_tracking_number_moves_step_by_step(self):
+        updates = [
+            {'tracking_number': 'PL0', 'status': 'in_transit'},
+            {'tracking_number': 'PL0', 'status': 'awaiting_pickup'},
+        ]
+
+        response = self.client.post('/api/update_status/bulk/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(Parcel.objects.get(tracking_number='PL0').status, Parcel.awaiting_pickup)
+
+    def test_rejects_unknown_status(self):
+        updates = [{'tracking_number': 'PL0', 'status': 'lost'}]
+
+        response = self.client.post('/api/update_status/bulk/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_the_courier_permission(self):
+        self.client.force_authenticate(User.objects.create_user('someone'))
+        updates = [{'tracking_number': 'PL0', 'status': 'in_transit'}]
+
+        response = self.client.post('/api/update_status/bulk/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Parcel.objects.get(tracking_number='PL0').status, Parcel.preparing)
+
+
+class BulkParcelCreateTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('business')
+        self.receiver = User.objects.create_user('receiver')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.first = create_locker('First', small_slots=2, medium_slots=1, large_slots=0)
+        self.second = create_locker('Second', small_slots=0, medium_slots=2, large_slots=0)
+
+    def item(self, number, locker, size='small'):
+        return {
+            'tracking_number': f'BULK{number}',
+            'parcel_locker': locker.id,
+            'size': size,
+            'receiver': self.receiver.id,
+        }
+
+    def test_places_parcels_and_reports_the_rest(self):
+        items = [
+            self.item(0, self.first),
+            self.item(1, self.second, 'medium'),
+            self.item(2, self.first),
+            self.item(3, self.first),
+            self.item(4, self.second, 'medium'),
+            {**self.item(5, self.first), 'parcel_locker': 0},
+        ]
+
+        response = self.client.post('/api/parcels/bulk_create/', {'parcels': items}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 5])
+        self.assertEqual(Parcel.objects.filter(sender=self.sender).count(), 4)
+        self.assertEqual(
+            Parcel.objects.filter(history__event_type='created', sender=self.sender).count(), 4
+        )
+        for locker in (self.first, self.second):
+            locker.refresh_from_db()
+            self.assertEqual(locker.available_slots_count, 1 if locker == self.first else 0)
+        self.assertEqual(LockerSlot.objects.filter(is_occupied=True).count(), 4)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        locker = create_locker('Big', small_slots=60, medium_slots=0, large_slots=0)
+
+        def send(offset, count):
+            items = [self.item(offset + i, locker) for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/parcels/bulk_create/', {'parcels': items}, format='json')
+            self.assertEqual(response.data['created'], count)
+            return len(queries)
+
+        self.assertEqual(send(0, 5), send(100, 50))
+
+    def test_rejects_duplicate_tracking_numbers(self):
+        Parcel.objects.create(
+            tracking_number='BULK0', parcel_locker=self.first, sender=self.sender, pickup_code='1'
+        )
+        items = [self.item(0, self.first), self.item(1, self.first), self.item(1, self.first)]
+
+        response = self.client.post('/api/parcels/bulk_create/', {'parcels': items}, format='json')
+
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 2])
+
+    def test_pickup_codes_are_unique_among_waiting_parcels(self):
+        Parcel.objects.create(tracking_number='WAITING', parcel_locker=self.first, pickup_code='123456')
+        codes = ['123456', '123456', '222222', '333333']
+
+        with mock.patch('paczkomatyapp.models.new_pickup_code', side_effect=codes):
+            parcels, errors = Parcel.bulk_send([self.item(0, self.first), self.item(1, self.first)], self.sender)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(parcel.pickup_code for parcel in parcels), ['222222', '333333'])
+        self.assertEqual(Parcel.find_for_pickup(self.first.id, '123456'), None)
+
+
+class ParcelTransitionTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender')
+        self.sender.user_permissions.add(Permission.objects.get(codename='update_parcel_status'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.locker = create_locker(small_slots=0, medium_slots=2, large_slots=0)
+        self.parcel = Parcel.objects.create(
+            tracking_number='PL0', parcel_locker=self.locker, sender=self.sender, pickup_code='1'
+        )
+
+    def history(self):
+        return list(self.parcel.history.order_by('id').values_list('event_type', flat=True))
+
+    def test_status_view_validates_transitions(self):
+        response = self.client.put('/api/update_status/', {'tracking_number': 'PL0', 'status': 'delivered'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put('/api/update_status/', {'tracking_number': 'PL0', 'status': 'in_transit'})
+        self.assertEqual(response.status_code, 200)
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.in_transit)
+        self.assertEqual(self.history(), ['created', 'in_transit'])
+
+    def test_status_view_is_for_couriers_only(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+        self.client.force_authenticate(User.objects.create_user('receiver'))
+
+        response = self.client.put('/api/update_status/', {'tracking_number': 'PL0', 'status': 'delivered'})
+
+        self.assertEqual(response.status_code, 403)
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.awaiting_pickup)
+
+    def test_transition_writes_one_update_and_one_insert(self):
+        parcel = Parcel.objects.for_transition().get(pk=self.parcel.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            parcel.transition_to(Parcel.in_transit)
+
+        writes = [q['sql'].split()[0] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(writes, ['UPDATE', 'INSERT'])
+
+    def test_delivery_frees_the_slot(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+        self.parcel.transition_to(Parcel.delivered)
+
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_medium_slots, 2)
+        self.assertFalse(LockerSlot.objects.filter(is_occupied=True).exists())
+        self.assertEqual(self.history(), ['created', 'placed_in_locker', 'delivered'])
+
+    def test_bulk_update_frees_slots_once(self):
+        Parcel.objects.create(tracking_number='PL1', parcel_locker=self.locker, sender=self.sender, pickup_code='1')
+        updates = [
+            {'tracking_number': 'PL0', 'status': 'awaiting_pickup'},
+            {'tracking_number': 'PL0', 'status': 'delivered'},
+            {'tracking_number': 'PL0', 'status': 'delivered'},
+            {'tracking_number': 'PL1', 'status': 'awaiting_pickup'},
+        ]
+
+        response = self.client.post('/api/update_status/bulk/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.data['updated'], 3)
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_medium_slots, 1)
+        self.assertEqual(LockerSlot.objects.filter(is_occupied=True).count(), 1)
+
+    def test_bulk_update_counts_only_slots_it_frees(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+        for_status = DeliveryHistory.for_status
+
+        def release_concurrently(status):
+            # The slot gets freed (and counted) after the batch has read it as occupied
+            self.assertTrue(Parcel.objects.get(pk=self.parcel.pk).release_slot())
+            return for_status(status)
+
+        with mock.patch.object(DeliveryHistory, 'for_status', side_effect=release_concurrently):
+            results = Parcel.bulk_update_status([('PL0', Parcel.delivered)])
+
+        self.assertEqual(results[0]['result'], 'updated')
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_medium_slots, 2)
+
+    def test_picked_up_requires_the_pickup_code(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+
+        response = self.client.put('/api/update_status/', {'tracking_number': 'PL0', 'status': 'picked_up'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/update_status/bulk/', {
+            'updates': [{'tracking_number': 'PL0', 'status': 'picked_up'}]
+        }, format='json')
+        self.assertEqual(response.data['updated'], 0)
+
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.awaiting_pickup)
+        self.assertTrue(self.parcel.pickup('1'))
+
+    def test_pickup_locks_the_parcel_row(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+        stale = Parcel.objects.get(pk=self.parcel.pk)
+        self.assertTrue(self.parcel.pickup('1'))
+
+        # A concurrent request that loaded the parcel before the first pickup committed
+        with mock.patch.object(ParcelViewSet, 'get_object', return_value=stale):
+            response = self.client.post(f'/api/parcels/{self.parcel.pk}/pickup/', {'pickup_code': '1'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.history().count('picked_up'), 1)
+
+    def test_status_is_read_only_on_parcel_update(self):
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+
+        response = self.client.patch(f"/api/parcels/{self.parcel.id}/", {'status': 'picked_up'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.awaiting_pickup)
+        self.assertTrue(self.parcel.locker_slot.is_occupied)
+        self.assertEqual(self.history(), ['created', 'placed_in_locker'])
+
+    def test_pickup_code_is_generated_by_the_server(self):
+        locker = create_locker('Codes', small_slots=2, medium_slots=0, large_slots=0)
+        Parcel.objects.create(tracking_number='WAITING', parcel_locker=locker, pickup_code='123456')
+
+        with mock.patch('paczkomatyapp.models.new_pickup_code', side_effect=['123456', '654321']):
+            response = self.client.post('/api/parcels/', {
+                'tracking_number': 'PL1', 'parcel_locker': locker.id, 'size': 'small', 'pickup_code': '123456'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('pickup_code', response.data)
+        self.assertEqual(Parcel.objects.get(tracking_number='PL1').pickup_code, '654321')
+
+    def test_pickup_code_is_shown_to_the_receiver_only(self):
+        receiver = User.objects.create_user('receiver')
+        Parcel.objects.filter(pk=self.parcel.pk).update(receiver=receiver)
+
+        def get_code(user):
+            self.client.force_authenticate(user)
+            return self.client.post('/api/get_pickup_code/', {'tracking_number': 'PL0'}, format='json')
+
+        self.assertEqual(get_code(self.sender).status_code, 404)
+        self.assertEqual(get_code(User.objects.create_user('other')).status_code, 404)
+        self.assertEqual(get_code(receiver).data, {'pickup_code': '1'})
+        # Without a registered receiver the sender passes the code on
+        Parcel.objects.filter(pk=self.parcel.pk).update(receiver=None)
+        self.assertEqual(get_code(self.sender).data, {'pickup_code': '1'})
+
+
+class KioskPickupTests(TestCase):
+    def setUp(self):
+        self.kiosk = User.objects.create_user('kiosk')
+        self.kiosk.user_permissions.add(Permission.objects.get(codename='operate_kiosk'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.kiosk)
+        self.locker = create_locker(small_slots=0, medium_slots=2, large_slots=0)
+        LockerKiosk.objects.create(user=self.kiosk, parcel_locker=self.locker)
+        self.parcel = Parcel.objects.create(tracking_number='PL0', parcel_locker=self.locker, pickup_code='123456')
+        self.parcel.transition_to(Parcel.awaiting_pickup)
+
+    def pickup(self, code, locker=None):
+        return self.client.post('/api/kiosk/pickup/', {
+            'parcel_locker': (locker or self.locker).id, 'pickup_code': code
+        }, format='json')
+
+    def test_pickup_code_is_stored_hashed(self):
+        self.assertEqual(self.parcel.pickup_code_hash, hash_pickup_code(self.locker.id, '123456'))
+        # The same code in another locker hashes differently
+        self.assertNotEqual(self.parcel.pickup_code_hash, hash_pickup_code(self.locker.id + 1, '123456'))
+
+    def test_parcel_pickup_checks_the_hash(self):
+        with self.assertRaises(ValidationError):
+            self.parcel.pickup('654321')
+        self.assertTrue(self.parcel.pickup('123456'))
+
+    def test_kiosk_opens_the_slot_from_the_code(self):
+        slot = self.parcel.locker_slot
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.pickup('123456')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'tracking_number': 'PL0', 'locker_slot': slot.id, 'slot_number': slot.slot_number})
+        # A single SELECT finds the parcel (and its slot) from the locker and code
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'paczkomatyapp_parcel' in q['sql']]
+        self.assertEqual(len(selects), 1)
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.picked_up)
+        self.assertEqual(self.pickup('123456').status_code, 404)
+
+    def test_wrong_code_or_locker_is_rejected(self):
+        other = create_locker('Other', small_slots=0, medium_slots=1, large_slots=0)
+        self.assertEqual(self.pickup('654321').status_code, 404)
+        # The kiosk account opens slots of its own locker only
+        self.assertEqual(self.pickup('123456', locker=other).status_code, 403)
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.status, Parcel.awaiting_pickup)
+
+    def test_requires_the_kiosk_permission(self):
+        self.client.force_authenticate(User.objects.create_user('receiver'))
+        self.assertEqual(self.pickup('123456').status_code, 403)
+
+    def test_migration_backfills_hashes(self):
+        Parcel.objects.update(pickup_code_hash='')
+        migration = importlib.import_module('paczkomatyapp.migrations.0019_parcel_pickup_code_hash')
+
+        migration.populate_pickup_code_hashes(apps, None)
+
+        self.parcel.refresh_from_db()
+        self.assertEqual(self.parcel.pickup_code_hash, hash_pickup_code(self.locker.id, '123456'))
+
+
+class KioskSyncTests(TestCase):
+    def setUp(self):
+        self.kiosk = User.objects.create_user('kiosk')
+        self.kiosk.user_permissions.add(Permission.objects.get(codename='operate_kiosk'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.kiosk)
+        self.locker = create_locker(small_slots=0, medium_slots=3, large_slots=0)
+        LockerKiosk.objects.create(user=self.kiosk, parcel_locker=self.locker)
+        self.parcels = [
+            Parcel.objects.create(tracking_number=f"PL{i}", parcel_locker=self.locker, pickup_code=f"code{i}")
+            for i in range(3)
+        ]
+        for parcel in self.parcels[:2]:
+            parcel.transition_to(Parcel.awaiting_pickup)
+        self.parcels[2].transition_to(Parcel.in_transit)
+
+    def sync(self, events):
+        return self.client.post('/api/kiosk/sync/', {'parcel_locker': self.locker.id, 'events': events}, format='json')
+
+    def test_snapshot_lets_the_kiosk_verify_codes(self):
+        Parcel.objects.create(tracking_number='OTHER', parcel_locker=create_locker('Other'), pickup_code='x')
+
+        response = self.client.get('/api/kiosk/snapshot/', {'parcel_locker': self.locker.id})
+
+        self.assertEqual(response.status_code, 200)
+        parcels = response.data['parcels']
+        self.assertEqual(parcels['id'], [parcel.id for parcel in self.parcels])
+        self.assertEqual(parcels['status'], ['awaiting_pickup', 'awaiting_pickup', 'in_transit'])
+        # The kiosk recomputes the hash of a typed code with the locker key
+        key = bytes.fromhex(response.data['locker_key'])
+        self.assertEqual(key, locker_key(self.locker.id))
+        self.assertEqual(parcels['pickup_code_hash'][0], hash_pickup_code(self.locker.id, 'code0'))
+
+    def test_sync_applies_pickups_idempotently(self):
+        events = [
+            {'parcel': self.parcels[0].id, 'pickup_code': 'code0'},
+            {'parcel': self.parcels[1].id, 'pickup_code': 'wrong'},
+            {'parcel': self.parcels[2].id, 'pickup_code': 'code2'},
+            {'parcel': self.parcels[0].id, 'pickup_code': 'code0'},
+        ]
+        self.locker.refresh_from_db()
+        free_slots = self.locker.free_medium_slots
+
+        response = self.sync(events)
+
+        self.assertEqual(response.data['picked_up'], 1)
+        self.assertEqual([result['result'] for result in response.data['results']],
+                         ['picked_up', 'error', 'error', 'duplicate'])
+        self.locker.refresh_from_db()
+        self.assertEqual(self.locker.free_medium_slots, free_slots + 1)
+
+        # The kiosk retries the batch after a lost response
+        response = self.sync(events[:1])
+        self.assertEqual(response.data['results'], [{'parcel': self.parcels[0].id, 'result': 'duplicate'}])
+        self.assertEqual(self.parcels[0].history.filter(event_type='picked_up').count(), 1)
+
+    def test_sync_writes_in_bulk(self):
+        events = [{'parcel': parcel.id, 'pickup_code': f"code{i}"} for i, parcel in enumerate(self.parcels[:2])]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.sync(events)
+
+        self.assertEqual(response.data['picked_up'], 2)
+        writes = [q['sql'].split()[0] for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+        # Parcels, slots, history, then the locker's free counter
+        self.assertEqual(writes, ['UPDATE', 'UPDATE', 'INSERT', 'UPDATE'])
+
+    def test_kiosk_gets_only_its_own_locker(self):
+        other = create_locker('Other')
+        staff = User.objects.create_user('staff', is_staff=True)
+
+        for user in (self.kiosk, staff):
+            self.client.force_authenticate(user)
+            response = self.client.get('/api/kiosk/snapshot/', {'parcel_locker': other.id})
+            self.assertEqual(response.status_code, 403)
+            self.assertNotIn('locker_key', response.data)
+        self.client.force_authenticate(self.kiosk)
+        response = self.client.post('/api/kiosk/sync/', {
+            'parcel_locker': other.id, 'events': [{'parcel': self.parcels[0].id, 'pickup_code': 'code0'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_sync_ignores_parcels_of_other_lockers(self):
+        other = create_locker('Other', small_slots=0, medium_slots=1, large_slots=0)
+        parcel = Parcel.objects.create(tracking_number='OTHER', parcel_locker=other, pickup_code='x')
+        parcel.transition_to(Parcel.awaiting_pickup)
+
+        response = self.sync([{'parcel': parcel.id, 'pickup_code': 'x'}])
+
+        self.assertEqual(response.data['results'][0]['detail'], 'Parcel not found.')
+
+
+class DeliveryHistoryArchiveTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        locker = create_locker(small_slots=0, medium_slots=2, large_slots=0)
+        self.old = Parcel.objects.create(tracking_number='OLD', parcel_locker=locker, sender=self.sender, pickup_code='1')
+        self.new = Parcel.objects.create(tracking_number='NEW', parcel_locker=locker, sender=self.sender, pickup_code='1')
+        DeliveryHistory.objects.filter(parcel=self.old).update(event_time=timezone.now() - timedelta(days=400))
+
+    def test_archive_command_moves_old_entries(self):
+        call_command('archive_delivery_history', stdout=StringIO())
+
+        self.assertFalse(DeliveryHistory.objects.filter(parcel=self.old).exists())
+        archived = ArchivedDeliveryHistory.objects.get(parcel=self.old)
+        self.assertEqual(archived.event_type, DeliveryHistory.CREATED)
+
+        recent = self.client.get('/api/delivery_history/')
+        self.assertEqual([entry['parcel'] for entry in recent.data['results']], [self.new.pk])
+        old = self.client.get('/api/delivery_history/?archived=true')
+        self.assertEqual([entry['parcel'] for entry in old.data['results']], [self.old.pk])
+        self.assertEqual(old.data['results'][0]['event_type_display'], 'Created')
+
+        history = self.client.get(f'/api/parcels/{self.old.pk}/history/?archived=true')
+        self.assertEqual([entry['event_type'] for entry in history.data], ['created'])
+
+    def test_archive_event_codes_are_stable(self):
+        # Stored in archived rows - changing a code would silently remap them
+        self.assertEqual(ArchivedDeliveryHistory.EVENT_CODES, {
+            'created': 1, 'placed_in_locker': 2, 'picked_up': 3, 'in_transit': 4, 'delivered': 5,
+        })
+        self.assertEqual(set(ArchivedDeliveryHistory.EVENT_CODES), set(dict(DeliveryHistory.EVENT_TYPES)))
+
+    def test_history_entries_are_append_only(self):
+        entry = DeliveryHistory.objects.get(parcel=self.new)
+        entry.event_type = DeliveryHistory.DELIVERED
+
+        with self.assertRaises(ValueError):
+            entry.save()
+
+
+class UserParcelInboxTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender')
+        self.receiver = User.objects.create_user('receiver')
+        self.locker = create_locker(small_slots=0, medium_slots=3, large_slots=0)
+
+    def roles(self, parcel):
+        return dict(parcel.memberships.values_list('user__username', 'role'))
+
+    def test_memberships_follow_sender_and_receiver(self):
+        parcel = Parcel.objects.create(
+            tracking_number='PL0', parcel_locker=self.locker, sender=self.sender,
+            receiver=self.receiver, pickup_code='1'
+        )
+        self.assertEqual(self.roles(parcel), {'sender': UserParcel.SENDER, 'receiver': UserParcel.RECEIVER})
+
+        parcel.receiver = self.sender
+        parcel.save()
+        self.assertEqual(self.roles(parcel), {'sender': UserParcel.BOTH})
+
+    def test_inbox_rows_carry_the_parcel_date(self):
+        parcel = Parcel.objects.create(
+            tracking_number='PL0', parcel_locker=self.locker, sender=self.sender,
+            receiver=self.receiver, pickup_code='1'
+        )
+
+        # The inbox is paged by (created_at, parcel) of these rows
+        self.assertEqual(set(UserParcel.objects.filter(parcel=parcel).values_list('created_at', flat=True)),
+                         {parcel.created_at})
+        self.assertEqual(list(UserParcel.parcel_ids(self.receiver)), [{'parcel_id': parcel.id}])
+
+    def test_bulk_send_fills_the_inbox(self):
+        items = [{
+            'tracking_number': 'BULK0', 'parcel_locker': self.locker.id,
+            'size': 'medium', 'receiver': self.receiver.id
+        }]
+        parcels, _ = Parcel.bulk_send(items, sender=self.sender)
+
+        self.assertEqual(self.roles(parcels[0]), {'sender': UserParcel.SENDER, 'receiver': UserParcel.RECEIVER})
+
+    def test_parcel_list_reads_the_inbox(self):
+        Parcel.objects.create(tracking_number='PL0', parcel_locker=self.locker, receiver=self.receiver, pickup_code='1')
+        Parcel.objects.create(tracking_number='PL1', parcel_locker=self.locker, sender=self.sender, pickup_code='1')
+        client = APIClient()
+        client.force_authenticate(self.receiver)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/parcels/')
+
+        self.assertEqual([parcel['tracking_number'] for parcel in response.data['results']], ['PL0'])
+        sql = next(query['sql'] for query in queries if 'paczkomatyapp_userparcel' in query['sql'])
+        # Sorted by the inbox columns (an annotation, rendered by position), not by the parcel table
+        self.assertNotIn('"paczkomatyapp_parcel"."created_at" DESC', sql)
+
+    @skipUnless(connection.vendor == 'sqlite', "SQLite query plan")
+    def test_inbox_page_is_read_in_index_order(self):
+        parcels = Parcel.objects.with_related().visible_to(self.receiver)
+
+        plan = parcels.order_by(*ParcelCursorPagination.inbox_ordering)[:50].explain()
+
+        self.assertIn('userparcel_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TokenUserCacheTests(TestCase):
+    def setUp(self):
+        token_user_cache.clear()
+        self.user = User.objects.create_user('cached')
+        self.client.cookies['authToken'] = str(AccessToken.for_user(self.user))
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/parcels/')
+        return response.status_code, sum('FROM "auth_user"' in query['sql'] for query in queries)
+
+    def test_repeated_requests_skip_the_user_query(self):
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.assertEqual(self.user_queries(), (200, 0))
+
+    def test_deactivation_invalidates_the_snapshot(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        status_code, _ = self.user_queries()
+        self.assertEqual(status_code, 401)
+
+    def test_cache_is_bounded_and_expires(self):
+        cache = TokenUserCache(maxsize=2, timeout=60)
+        for jti in 'abc':
+            cache.set(jti, self.user, time.time() + 60)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), self.user)
+
+        cache.set('old', self.user, time.time() - 1)
+        self.assertIsNone(cache.get('old'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkSuiteTests(TestCase):
+    def test_generator_creates_the_requested_data(self):
+        call_command('generate_benchmark_data', lockers=3, users=4, parcels=20, prefix='t', stdout=StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith='t-user-').count(), 4)
+        self.assertTrue(User.objects.get(username='t-courier').has_perm('paczkomatyapp.update_parcel_status'))
+        self.assertEqual(ParcelLocker.objects.filter(name__startswith='t-').count(), 3)
+        self.assertEqual(Parcel.objects.filter(tracking_number__startswith='T').count(), 20)
+
+    def test_lifecycle_workload_records_every_step(self):
+        from benchmarks.lifecycle import STEPS, InProcessSession, Recorder, courier_session, lifecycle
+
+        locker = create_locker(small_slots=2)
+        lockers = [{'id': locker.id, 'latitude': 52.0, 'longitude': 21.0}]
+        User.objects.create_user('courier', password='pass').user_permissions.add(
+            Permission.objects.get(codename='update_parcel_status')
+        )
+        courier = courier_session(InProcessSession, 'courier', 'pass')
+        recorder = Recorder()
+
+        for index in range(2):
+            lifecycle(InProcessSession(), courier, recorder, 'test', index, lockers, random.Random(index))
+
+        summaries = {summary['name']: summary for summary in recorder.summaries(elapsed=1.0)}
+        self.assertEqual(set(summaries), set(STEPS))
+        self.assertEqual(sum(summary['errors'] for summary in summaries.values()), 0)
+        self.assertEqual(summaries['status_update']['requests'], 4)
+        self.assertGreater(summaries['send']['queries_avg'], 0)
+
+
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        create_locker()
+
+    def test_server_timing_reports_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/public_parcel_lockers/')
+
+        self.assertRegex(response['Server-Timing'], rf'^app;dur=[\d.]+, db;dur=[\d.]+;desc="{len(queries)} queries"$')
+
+    async def test_server_timing_counts_queries_of_async_views(self):
+        await cache.aclear()
+
+        response = await self.async_client.get('/api/async/public_parcel_lockers/')
+
+        self.assertEqual(response.status_code, 200)
+        # The locker list is read in a sync_to_async() thread, not on the event loop's connection
+        self.assertTrue(response['Server-Timing'].endswith('desc="1 queries"'))
+
+    def test_metrics_endpoint_serves_histograms(self):
+        self.client.get('/api/public_parcel_lockers/')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE paczkomaty_request_duration_seconds histogram', body)
+        self.assertIn(
+            'paczkomaty_db_queries_count{view="paczkomatyapp.views.PublicParcelLockerListView"} 1', body
+        )
+        self.assertIn('le="+Inf"', body)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled_middleware_is_not_used(self):
+        response = self.client.get('/api/public_parcel_lockers/')
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+STRICT_QUERY_DETECTOR = {'ENABLED': True, 'N_PLUS_ONE_THRESHOLD': 5, 'SLOW_QUERY_MS': 1000, 'STRICT': True}
+
+
+@override_settings(
+    QUERY_DETECTOR=STRICT_QUERY_DETECTOR,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryDetectorTests(TestCase):
+    def setUp(self):
+        token_user_cache.clear()
+        self.locker = create_locker(small_slots=6)
+
+    def test_sql_shapes_ignore_parameters(self):
+        self.assertEqual(
+            normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            normalize_sql('SELECT * FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 1'),
+        )
+
+    def test_reports_repeated_queries_with_serializer_field(self):
+        for i in range(5):
+            Parcel.objects.create(tracking_number=f'PL{i}', parcel_locker=self.locker, pickup_code='1')
+        log = QueryLog()
+
+        with connection.execute_wrapper(log):
+            ParcelSerializer(Parcel.objects.all(), many=True).data
+
+        fields = {queries[0].field for queries in log.repeated(5).values()}
+        self.assertIn('ParcelSerializer.parcel_locker_name', fields)
+
+    def test_strict_mode_fails_on_exceeded_budget(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+        with mock.patch.object(ParcelViewSet, 'query_budget', {'list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                client.get('/api/parcels/')
+
+    async def test_async_views_are_checked(self):
+        await cache.aclear()
+
+        with mock.patch.object(async_views.public_parcel_lockers, 'query_budget', 0, create=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                await self.async_client.get('/api/async/public_parcel_lockers/')
+
+    def test_parcel_lifecycle_stays_within_budgets(self):
+        response = self.client.post('/api/user/register/', {'username': 'alice', 'password': 'pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/token/', {'username': 'alice', 'password': 'pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(username='alice')
+        courier = Client()
+        User.objects.create_user('courier', password='pass').user_permissions.add(
+            Permission.objects.get(codename='update_parcel_status')
+        )
+        response = courier.post('/api/token/', {'username': 'courier', 'password': 'pass'},
+                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        token_user_cache.clear()
+
+        response = self.client.post('/api/parcels/', {
+            'tracking_number': 'PL0', 'parcel_locker': self.locker.id, 'size': 'small',
+            'receiver': user.id
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        parcel_id = response.json()['id']
+        for status in ('in_transit', 'awaiting_pickup'):
+            response = courier.put('/api/update_status/', {'tracking_number': 'PL0', 'status': status},
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200, status)
+        response = self.client.post('/api/get_pickup_code/', {'tracking_number': 'PL0'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(f'/api/parcels/{parcel_id}/pickup/', {'pickup_code': response.json()['pickup_code']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        for url in [
+            '/api/parcels/', f'/api/parcels/{parcel_id}/', f'/api/parcels/{parcel_id}/history/',
+            '/api/delivery_history/', '/api/users/', f'/api/users/{user.id}/', f'/api/users/{user.id}/parcels/',
+            '/api/parcel_lockers/', '/api/locker_slots/', '/api/public_parcel_lockers/',
+            '/api/public_parcel_lockers/map/?bbox=20,51,22,53&zoom=16',
+        ]:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views, metrics
 from .views import (
     ParcelLockerViewSet, 
     LockerSlotViewSet, 
@@ -7,8 +8,13 @@ from .views import (
     DeliveryHistoryViewSet,
     UserViewSet,
     UpdateParcelStatusView,
+    BulkUpdateParcelStatusView,
     PickupCodeView,
-    PublicParcelLockerListView
+    KioskPickupView,
+    KioskSnapshotView,
+    KioskSyncView,
+    PublicParcelLockerListView,
+    PublicParcelLockerMapView
 )
 
 router = DefaultRouter()
@@ -21,6 +27,17 @@ router.register(r'api/delivery_history', DeliveryHistoryViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('api/update_status/', UpdateParcelStatusView.as_view()),
+    path('api/update_status/bulk/', BulkUpdateParcelStatusView.as_view()),
     path('api/get_pickup_code/', PickupCodeView.as_view()),
+    path('api/kiosk/pickup/', KioskPickupView.as_view()),
+    path('api/kiosk/snapshot/', KioskSnapshotView.as_view()),
+    path('api/kiosk/sync/', KioskSyncView.as_view()),
     path('api/public_parcel_lockers/', PublicParcelLockerListView.as_view()),
+    path('api/public_parcel_lockers/map/', PublicParcelLockerMapView.as_view()),
+    path('api/events/', async_views.parcel_events),
+    path('api/async/public_parcel_lockers/', async_views.public_parcel_lockers),
+    path('api/async/parcels/', async_views.parcel_list),
+    path('api/async/parcels/<int:pk>/', async_views.parcel_detail),
+    path('api/async/parcels/<int:pk>/history/', async_views.parcel_history),
+    path('metrics', metrics.metrics),
 ]
\ No newline at end of file
@@ -1,15 +1,30 @@
+import math
+
 from rest_framework import generics, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Avg, Count, FloatField, Prefetch, Q, Sum
+from django.db.models.functions import Cast, Floor
 from django.shortcuts import get_object_or_404
-from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny, BasePermission
 from rest_framework_simplejwt.views import TokenObtainPairView as SimpleJWTTokenObtainPairView
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
 from rest_framework.views import APIView
 
-from .models import ParcelLocker, LockerSlot, Parcel, DeliveryHistory
+from .models import (
+    ParcelLocker, LockerSlot, Parcel, DeliveryHistory, ArchivedDeliveryHistory, UserParcel, LockerKiosk
+)
+from .cache import cached_availability_response
+from .geo import grid_cell
+from .importers import import_lockers, read_uploaded_locker_rows
+from .pagination import ParcelCursorPagination, DeliveryHistoryCursorPagination, LockerSlotCursorPagination
+from .pickup_codes import locker_key
+from .renderers import compact_renderer_classes, to_columns
+from .search import FullTextSearchFilter, get_search_backend
 from .serializers import (
     UserSerializer,
     ParcelLockerSerializer,
@@ -19,6 +34,11 @@ from .serializers import (
     ParcelSerializer,
     ParcelDetailSerializer,
     ParcelPickupSerializer,
+    ParcelStatusUpdateSerializer,
+    BulkParcelStatusUpdateSerializer,
+    BulkParcelCreateSerializer,
+    KioskPickupSerializer,
+    KioskSyncSerializer,
     DeliveryHistorySerializer
 )
 from paczkomatyapp.auth import MyTokenObtainPairSerializer
@@ -31,6 +51,13 @@ class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+    # Queries per request (or per viewset action), checked by QueryDetectorMiddleware
+    query_budget = 4
+
+
+def include_archived(params):
+    """Whether the request opted into reading archived delivery history (?archived=true)"""
+    return params.get('archived', '').lower() in ('1', 'true', 'yes')
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -41,12 +68,20 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = {'list': 4, 'retrieve': 4, 'parcels': 4}
 
     def get_queryset(self):
-        # If user is admin, return all users, otherwise just the current user
+        # If user is admin, return all users, otherwise just the current user.
+        # UserSerializer only lists parcel ids, so the prefetches load nothing else
+        queryset = User.objects.all()
+        if self.action != 'parcels':
+            queryset = queryset.prefetch_related(
+                Prefetch('sent_parcels', queryset=Parcel.objects.only('id', 'sender')),
+                Prefetch('received_parcels', queryset=Parcel.objects.only('id', 'receiver')),
+            )
         if self.request.user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+            return queryset
+        return queryset.filter(id=self.request.user.id)
 
     @action(detail=True, methods=['get'])
     def parcels(self, request, pk=None):
@@ -60,17 +95,24 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        sent_parcels = Parcel.objects.filter(sender=user)
-        received_parcels = Parcel.objects.filter(receiver=user)
-
-        sent_serializer = ParcelSerializer(sent_parcels, many=True)
-        received_serializer = ParcelSerializer(received_parcels, many=True)
+        parcels = Parcel.objects.with_related()
 
         return Response({
-            'sent_parcels': sent_serializer.data,
-            'received_parcels': received_serializer.data
+            'sent_parcels': self.paginate_parcels(parcels.filter(sender=user), 'sent_cursor'),
+            'received_parcels': self.paginate_parcels(parcels.filter(receiver=user), 'received_cursor')
         })
 
+    def paginate_parcels(self, queryset, cursor_query_param):
+        # Each list has its own cursor parameter so they can be paged independently
+        paginator = ParcelCursorPagination()
+        paginator.cursor_query_param = cursor_query_param
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        return {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': ParcelSerializer(page, many=True).data
+        }
+
 
 class ParcelLockerViewSet(viewsets.ModelViewSet):
     """
@@ -80,12 +122,18 @@ class ParcelLockerViewSet(viewsets.ModelViewSet):
     """
     queryset = ParcelLocker.objects.all()
     serializer_class = ParcelLockerSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'location']
     ordering_fields = ['name', 'location', 'created_at']
+    query_budget = {'list': 2, 'nearby': 2}
+
+    NEARBY_DEFAULT_RADIUS_KM = 5
+    NEARBY_MAX_RADIUS_KM = 50
+    NEARBY_DEFAULT_LIMIT = 10
+    NEARBY_MAX_LIMIT = 100
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk_import']:
             permission_classes = [IsAdminUser]
         else:
             permission_classes = [IsAuthenticated]
@@ -96,6 +144,64 @@ class ParcelLockerViewSet(viewsets.ModelViewSet):
             return ParcelLockerDetailSerializer
         return ParcelLockerSerializer
 
+    def list(self, request, *args, **kwargs):
+        # The list is the same for every user, so it is cached per query string
+        return cached_availability_response(
+            request,
+            'parcel_lockers',
+            lambda: super(ParcelLockerViewSet, self).list(request, *args, **kwargs).data
+        )
+
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """Import many lockers at once from a JSON list or an uploaded CSV/JSON file"""
+        uploaded_file = request.FILES.get('file')
+        try:
+            rows = read_uploaded_locker_rows(uploaded_file) if uploaded_file else request.data
+            if not isinstance(rows, list):
+                raise ValueError("Expected a list of lockers or an uploaded 'file'.")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, errors = import_lockers(rows)
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"created": created}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """Get the nearest lockers around a point, optionally only those with a free slot of a given size"""
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', self.NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(request.query_params.get('limit', self.NEARBY_DEFAULT_LIMIT))
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "lat and lng are required; lat, lng, radius and limit must be numbers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        size = request.query_params.get('size', None)
+        if size and size not in dict(LockerSlot.SIZE_CHOICES):
+            return Response({"detail": f"Unknown size '{size}'."}, status=status.HTTP_400_BAD_REQUEST)
+        # float() accepts 'nan' and 'inf', which the range checks below would let through
+        if not all(map(math.isfinite, (lat, lng, radius))):
+            return Response({"detail": "lat, lng and radius must be finite numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0 or limit <= 0:
+            return Response({"detail": "Coordinates, radius or limit out of range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        radius = min(radius, self.NEARBY_MAX_RADIUS_KM)
+        limit = min(limit, self.NEARBY_MAX_LIMIT)
+        nearest = ParcelLocker.nearest(lat, lng, radius, size=size, limit=limit)
+
+        data = []
+        for distance, locker in nearest:
+            item = ParcelLockerSerializer(locker).data
+            item['distance_km'] = round(distance, 3)
+            data.append(item)
+        return Response(data)
+
     @action(detail=True, methods=['get'])
     def slots(self, request, pk=None):
         """Get all slots for a specific locker"""
@@ -126,6 +232,8 @@ class LockerSlotViewSet(viewsets.ModelViewSet):
     """
     queryset = LockerSlot.objects.all()
     serializer_class = LockerSlotSerializer
+    pagination_class = LockerSlotCursorPagination
+    query_budget = {'list': 2, 'retrieve': 2}
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['slot_number', 'size']
     ordering_fields = ['slot_number', 'size', 'last_updated']
@@ -163,6 +271,23 @@ class LockerSlotViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    # Admin slot edits keep the locker's free slot counters in sync
+    def perform_create(self, serializer):
+        slot = serializer.save()
+        slot.parcel_locker.refresh_free_slots()
+
+    def perform_update(self, serializer):
+        previous_locker = serializer.instance.parcel_locker
+        slot = serializer.save()
+        slot.parcel_locker.refresh_free_slots()
+        if previous_locker.pk != slot.parcel_locker_id:
+            previous_locker.refresh_free_slots()
+
+    def perform_destroy(self, instance):
+        locker = instance.parcel_locker
+        instance.delete()
+        locker.refresh_free_slots()
+
 
 class ParcelViewSet(viewsets.ModelViewSet):
     """
@@ -172,8 +297,12 @@ class ParcelViewSet(viewsets.ModelViewSet):
     """
     queryset = Parcel.objects.all()
     serializer_class = ParcelSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['tracking_number', 'status']
+    pagination_class = ParcelCursorPagination
+    query_budget = {'list': 2, 'retrieve': 3, 'create': 11, 'pickup': 7, 'history': 4}
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
+    # Only the FTS-indexed field: an icontains on status ORed with the FTS match scans the table.
+    # Filtering by status is the exact ?status= parameter (see get_queryset)
+    search_fields = ['tracking_number']
     ordering_fields = ['created_at', 'status']
 
     def get_permissions(self):
@@ -193,12 +322,9 @@ class ParcelViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
-        # Admin users can see all parcels
-        if user.is_staff:
-            queryset = Parcel.objects.all()
-        else:
-            # Regular users can only see parcels they've sent or received
-            queryset = Parcel.objects.filter(Q(sender=user) | Q(receiver=user))
+        # Load the relations used by ParcelSerializer together with the parcels.
+        # Regular users can only see parcels they've sent or received (their inbox), admins see all
+        queryset = Parcel.objects.with_related().visible_to(user)
 
         # Filter by parcel_locker if provided
         locker_id = self.request.query_params.get('locker', None)
@@ -213,7 +339,7 @@ class ParcelViewSet(viewsets.ModelViewSet):
         # Filter by tracking number if provided
         tracking_number = self.request.query_params.get('tracking', None)
         if tracking_number:
-            queryset = queryset.filter(tracking_number__icontains=tracking_number)
+            queryset = get_search_backend().filter(queryset, ['tracking_number'], tracking_number)
 
         return queryset
 
@@ -230,7 +356,9 @@ class ParcelViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             try:
                 provided_code = serializer.validated_data['pickup_code']
-                success = parcel.pickup(provided_code)
+                # Re-read the parcel with its row locked, so concurrent pickups are serialized
+                with transaction.atomic():
+                    success = Parcel.objects.for_transition().get(pk=parcel.pk).pickup(provided_code)
 
                 if success:
                     return Response({
@@ -244,11 +372,30 @@ class ParcelViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk_create')
+    def bulk_send(self, request):
+        """Send many parcels at once; items that cannot be placed are reported, the rest are created"""
+        serializer = BulkParcelCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        parcels, errors = Parcel.bulk_send(serializer.validated_data['parcels'], sender=request.user)
+        return Response({
+            'created': len(parcels),
+            'parcels': [
+                {'id': parcel.id, 'tracking_number': parcel.tracking_number, 'locker_slot': parcel.locker_slot_id}
+                for parcel in parcels
+            ],
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if parcels else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         """Get delivery history for a specific parcel"""
         parcel = self.get_object()
-        history = parcel.history.all().order_by('-event_time')
+        history = list(parcel.history.all().order_by('-event_time'))
+        if include_archived(request.query_params):
+            history += parcel.archived_history.order_by('-event_time')
         serializer = DeliveryHistorySerializer(history, many=True)
         return Response(serializer.data)
 
@@ -256,26 +403,28 @@ class ParcelViewSet(viewsets.ModelViewSet):
 class DeliveryHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for DeliveryHistory - read-only access
-    Users can only see history for parcels they've sent or received
+    Users can only see history for parcels they've sent or received.
+    Only recent history is read by default; ?archived=true reads the archive instead.
     """
     queryset = DeliveryHistory.objects.all()
     serializer_class = DeliveryHistorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DeliveryHistoryCursorPagination
+    query_budget = {'list': 2, 'retrieve': 2}
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['event_time']
-    ordering = ['-event_time']  # Default ordering
+    ordering = ['-event_time', '-id']  # Default ordering
 
     def get_queryset(self):
         user = self.request.user
+        model = ArchivedDeliveryHistory if include_archived(self.request.query_params) else DeliveryHistory
 
         # Admin users can see all history
         if user.is_staff:
-            queryset = DeliveryHistory.objects.all()
+            queryset = model.objects.all()
         else:
             # Regular users can only see history for parcels they've sent or received
-            queryset = DeliveryHistory.objects.filter(
-                Q(parcel__sender=user) | Q(parcel__receiver=user)
-            )
+            queryset = model.objects.filter(parcel_id__in=UserParcel.parcel_ids(user))
 
         # Filter by parcel if provided
         parcel_id = self.request.query_params.get('parcel', None)
@@ -285,7 +434,10 @@ class DeliveryHistoryViewSet(viewsets.ReadOnlyModelViewSet):
         # Filter by event_type if provided
         event_type = self.request.query_params.get('event_type', None)
         if event_type:
-            queryset = queryset.filter(event_type=event_type)
+            if model is ArchivedDeliveryHistory:
+                queryset = queryset.filter(event=ArchivedDeliveryHistory.EVENT_CODES.get(event_type))
+            else:
+                queryset = queryset.filter(event_type=event_type)
 
         return queryset
 
@@ -325,59 +477,316 @@ class CheckIsSuperUserView(APIView):
         return Response({"is_superuser": bool(getattr(request.user, "is_superuser", False))})
 
 
+class IsCourier(BasePermission):
+    """Couriers (accounts with the update_parcel_status permission) and staff"""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (
+            user.is_staff or user.has_perm('paczkomatyapp.update_parcel_status')
+        ))
+
+
 class UpdateParcelStatusView(APIView):
-    permission_classes = [IsAuthenticated]
+    """
+    Courier status change of one parcel. Receivers complete their parcels through the pickup
+    code (ParcelViewSet.pickup, the kiosk endpoints), so this is not open to every user.
+    """
+    permission_classes = [IsCourier]
+    # 2 of them load the courier's permissions
+    query_budget = 9
 
+    @transaction.atomic
     def put(self, request):
-        tracking_number = request.data.get('tracking_number')
-        new_status = request.data.get('status')
-        if not tracking_number or not new_status:
-            return Response({'detail': 'tracking_number and status are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ParcelStatusUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
-            parcel = Parcel.objects.get(tracking_number=tracking_number)
+            parcel = Parcel.objects.for_transition().get(
+                tracking_number=serializer.validated_data['tracking_number']
+            )
         except Parcel.DoesNotExist:
             return Response({'detail': 'Parcel not found.'}, status=status.HTTP_404_NOT_FOUND)
-        parcel.status = new_status
-        parcel.save()
+        try:
+            parcel.transition_to(serializer.validated_data['status'])
+        except ValidationError as e:
+            return Response({'detail': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'detail': 'Status updated successfully.'})
 
 
+class BulkUpdateParcelStatusView(APIView):
+    """Change the status of many parcels in one request (e.g. a courier unloading a van)"""
+    permission_classes = [IsCourier]
+    # 2 for the courier's permissions, then one read and one write per table; parcels that had no
+    # slot yet and lockers whose counters change add a query each
+    query_budget = 10
+
+    def post(self, request):
+        serializer = BulkParcelStatusUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updates = [(item['tracking_number'], item['status']) for item in serializer.validated_data['updates']]
+        results = Parcel.bulk_update_status(updates)
+        return Response({
+            'updated': sum(1 for result in results if result['result'] == 'updated'),
+            'results': results
+        })
+
+
 class PickupCodeView(APIView):
+    """
+    The pickup code of a parcel, for its receiver only (or for the sender of a parcel without
+    a registered receiver, who passes the code on). Anyone else gets the same 404 as for an
+    unknown tracking number.
+    """
     permission_classes = [IsAuthenticated]
+    query_budget = 2
 
     def post(self, request):
         tracking_number = request.data.get('tracking_number')
         if not tracking_number:
             return Response({'detail': 'tracking_number is required.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            parcel = Parcel.objects.get(tracking_number=tracking_number)
+            parcel = Parcel.objects.get(
+                Q(receiver=request.user) | Q(receiver__isnull=True, sender=request.user),
+                tracking_number=tracking_number,
+            )
         except Parcel.DoesNotExist:
             return Response({'detail': 'Parcel not found.'}, status=status.HTTP_404_NOT_FOUND)
         return Response({'pickup_code': parcel.pickup_code})
 
 
+class IsKiosk(BasePermission):
+    """Locker terminals: accounts with the operate_kiosk permission, bound to a locker by LockerKiosk"""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.has_perm('paczkomatyapp.operate_kiosk'))
+
+
+def kiosk_locker_forbidden(request, parcel_locker_id):
+    """403 response unless the kiosk account is bound to the given locker (see LockerKiosk)"""
+    if LockerKiosk.locker_id_of(request.user) == parcel_locker_id:
+        return None
+    return Response(
+        {'detail': 'This account is not the kiosk of the given parcel locker.'},
+        status=status.HTTP_403_FORBIDDEN
+    )
+
+
+class KioskPickupView(APIView):
+    """
+    Locker terminal flow: the receiver types only the pickup code, the kiosk gets the slot to open.
+    The parcel is found by (locker, code hash) in one indexed query and picked up in the same transaction.
+    """
+    permission_classes = [IsKiosk]
+    # 2 of them load the kiosk account's permissions (once per request), 1 its locker binding
+    query_budget = 9
+
+    @transaction.atomic
+    def post(self, request):
+        serializer = KioskPickupSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        forbidden = kiosk_locker_forbidden(request, serializer.validated_data['parcel_locker'])
+        if forbidden:
+            return forbidden
+
+        parcel = Parcel.find_for_pickup(
+            serializer.validated_data['parcel_locker'], serializer.validated_data['pickup_code']
+        )
+        if parcel is None:
+            return Response({'detail': 'Invalid pickup code.'}, status=status.HTTP_404_NOT_FOUND)
+        slot = parcel.locker_slot
+        parcel.transition_to(Parcel.picked_up, code_verified=True)
+        return Response({
+            'tracking_number': parcel.tracking_number,
+            'locker_slot': slot.id if slot else None,
+            'slot_number': slot.slot_number if slot else None,
+        })
+
+
+class KioskSnapshotView(APIView):
+    """
+    Offline cache of a locker terminal: the locker's key and its expected parcels (slot, hashed
+    pickup code, status) as parallel arrays. With the key the kiosk verifies codes locally
+    (HMAC-SHA256 of the code, see pickup_codes.py) and reports pickups later via KioskSyncView.
+    """
+    permission_classes = [IsKiosk]
+    # Auth, 2 for the permissions, 1 for the kiosk binding, 1 for the parcels
+    query_budget = 5
+
+    def get(self, request):
+        try:
+            parcel_locker_id = int(request.query_params['parcel_locker'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'parcel_locker is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        # The key and the code hashes are handed out to the locker's own kiosk only
+        forbidden = kiosk_locker_forbidden(request, parcel_locker_id)
+        if forbidden:
+            return forbidden
+
+        rows = Parcel.objects.filter(
+            parcel_locker_id=parcel_locker_id,
+            status__in=[Parcel.in_transit, Parcel.awaiting_pickup]
+        ).order_by('id').values('id', 'locker_slot', 'locker_slot__slot_number', 'pickup_code_hash', 'status')
+        return Response({
+            'parcel_locker': parcel_locker_id,
+            'locker_key': locker_key(parcel_locker_id).hex(),
+            'generated_at': timezone.now(),
+            'parcels': to_columns([{
+                'id': row['id'],
+                'locker_slot': row['locker_slot'],
+                'slot_number': row['locker_slot__slot_number'],
+                'pickup_code_hash': row['pickup_code_hash'],
+                'status': row['status'],
+            } for row in rows]),
+        })
+
+
+class KioskSyncView(APIView):
+    """
+    Batch upload of pickups made by a locker terminal while working from its snapshot.
+    Idempotent: a retried batch reports already picked up parcels as 'duplicate'.
+    """
+    permission_classes = [IsKiosk]
+    query_budget = 9
+
+    def post(self, request):
+        serializer = KioskSyncSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        forbidden = kiosk_locker_forbidden(request, serializer.validated_data['parcel_locker'])
+        if forbidden:
+            return forbidden
+
+        events = [(event['parcel'], event['pickup_code']) for event in serializer.validated_data['events']]
+        results = Parcel.bulk_pickup(serializer.validated_data['parcel_locker'], events)
+        return Response({
+            'picked_up': sum(1 for result in results if result['result'] == 'picked_up'),
+            'results': results
+        })
+
+
+def public_locker_data(locker):
+    return {
+        'id': locker.id,
+        'name': locker.name,
+        'location': locker.location,
+        'latitude': float(locker.latitude),
+        'longitude': float(locker.longitude),
+        'available_slots': locker.available_slots_by_size
+    }
+
+
 # PUBLIC endpoint for parcel locker locations (no authentication required)
 class PublicParcelLockerListView(APIView):
     permission_classes = [AllowAny]
+    # Public data: skip authenticating the auth cookie (a user query) altogether
+    authentication_classes = []
+    query_budget = 1
+    # JSON rows by default, columnar JSON / MessagePack via Accept header or ?format=
+    renderer_classes = compact_renderer_classes()
 
     def get(self, request):
-        from .models import ParcelLocker, LockerSlot
-        lockers = ParcelLocker.objects.all()
-        data = []
-        for locker in lockers:
-            available_small = LockerSlot.objects.filter(parcel_locker=locker, size='small', is_occupied=False).count()
-            available_medium = LockerSlot.objects.filter(parcel_locker=locker, size='medium', is_occupied=False).count()
-            available_large = LockerSlot.objects.filter(parcel_locker=locker, size='large', is_occupied=False).count()
-            data.append({
-                'id': locker.id,
-                'name': locker.name,
-                'location': locker.location,
-                'latitude': float(locker.latitude),
-                'longitude': float(locker.longitude),
-                'available_slots': {
-                    'small': available_small,
-                    'medium': available_medium,
-                    'large': available_large,
+        # Free slot counters are stored on the locker row, so this is a single query
+        return cached_availability_response(
+            request,
+            'public_parcel_lockers',
+            lambda: [public_locker_data(locker) for locker in ParcelLocker.objects.all()]
+        )
+
+
+# PUBLIC endpoint for the map viewport: clusters at low zoom, single lockers at high zoom
+class PublicParcelLockerMapView(APIView):
+    permission_classes = [AllowAny]
+    # Public data: skip authenticating the auth cookie (a user query) altogether
+    authentication_classes = []
+    query_budget = 1
+
+    # From this zoom level on, lockers are returned one by one
+    CLUSTER_MAX_ZOOM = 14
+    # Cluster grid cells per 256px map tile (one cell ~ 64px on screen)
+    CELLS_PER_TILE = 4
+    # Upper bound on individual lockers returned for a single viewport
+    MAX_LOCKERS = 2000
+
+    def get(self, request):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(value) for value in request.query_params['bbox'].split(','))
+            zoom = int(request.query_params.get('zoom', self.CLUSTER_MAX_ZOOM))
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'bbox=min_lng,min_lat,max_lng,max_lat is required and zoom must be an integer.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Comparisons with NaN are always false, so they are ruled out by the range checks
+        in_range = -180 <= min_lng <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90
+        if not in_range or not 0 <= zoom <= 22:
+            return Response({'detail': 'Invalid bbox or zoom.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return cached_availability_response(
+            request,
+            'public_parcel_locker_map',
+            lambda: self.viewport_data(min_lng, min_lat, max_lng, max_lat, zoom)
+        )
+
+    def viewport_data(self, min_lng, min_lat, max_lng, max_lat, zoom):
+        # Grid cells covering the viewport narrow the search on the grid index,
+        # the exact coordinates then drop the lockers outside the bbox
+        lockers = ParcelLocker.objects.filter(
+            grid_lat__range=(grid_cell(min_lat), grid_cell(max_lat)),
+            grid_lng__range=(grid_cell(min_lng), grid_cell(max_lng)),
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng)
+        )
+
+        if zoom >= self.CLUSTER_MAX_ZOOM:
+            # One locker over the limit tells whether the list was cut
+            lockers = list(lockers.order_by('id')[:self.MAX_LOCKERS + 1])
+            return {
+                'zoom': zoom,
+                'clustered': False,
+                'truncated': len(lockers) > self.MAX_LOCKERS,
+                'lockers': [public_locker_data(locker) for locker in lockers[:self.MAX_LOCKERS]]
+            }
+
+        # Group lockers into grid cells sized to the zoom level, aggregated in the database
+        cell = 360 / (2 ** zoom) / self.CELLS_PER_TILE
+        clusters = (
+            lockers
+            .annotate(
+                cell_x=Floor(Cast('longitude', FloatField()) / cell),
+                cell_y=Floor(Cast('latitude', FloatField()) / cell),
+            )
+            .values('cell_x', 'cell_y')
+            .annotate(
+                count=Count('id'),
+                latitude=Avg(Cast('latitude', FloatField())),
+                longitude=Avg(Cast('longitude', FloatField())),
+                small=Sum('free_small_slots'),
+                medium=Sum('free_medium_slots'),
+                large=Sum('free_large_slots'),
+            )
+            .order_by()
+        )
+        return {
+            'zoom': zoom,
+            'clustered': True,
+            'truncated': False,
+            'clusters': [
+                {
+                    'latitude': cluster['latitude'],
+                    'longitude': cluster['longitude'],
+                    'count': cluster['count'],
+                    'available_slots': {
+                        LockerSlot.SMALL: cluster['small'],
+                        LockerSlot.MEDIUM: cluster['medium'],
+                        LockerSlot.LARGE: cluster['large'],
+                    }
                 }
-            })
-        return Response(data)
\ No newline at end of file
+                for cluster in clusters
+            ]
+        }
@@ -11,6 +11,7 @@ import {
   Search,
 } from "lucide-react";
 import { ParcelPickupModal } from "@/components/ParcelPickupModal";
+import { fetchRemainingPages } from "@/lib/utils";
 
 interface LockerSlotInfo {
   id: number;
@@ -109,7 +110,7 @@ export default function DashboardPage() {
   const [isNewParcelModalOpen, setIsNewParcelModalOpen] = useState(false);
   const [searchQuery, setSearchQuery] = useState("");
   const [showThankYou, setShowThankYou] = useState(false);
-  const [pickupModalTracking, setPickupModalTracking] = useState<string | null>(null);
+  const [pickupModalParcel, setPickupModalParcel] = useState<Parcel | null>(null);
   const [selectedParcel, setSelectedParcel] = useState<any | null>(null);
   const [isDetailsModalOpen, setIsDetailsModalOpen] = useState(false);
   const [detailsLoading, setDetailsLoading] = useState(false);
@@ -121,7 +122,7 @@ export default function DashboardPage() {
     const fetchParcels = async () => {
       try {
         console.log("Fetching parcels data from API");
-        const response = await fetch("http://localhost:8000/api/parcels", {
+        const response = await fetch("http://localhost:8000/api/parcels/?page_size=100", {
           credentials: "include",
           headers: {
             "Content-Type": "application/json",
@@ -160,8 +161,14 @@ export default function DashboardPage() {
         }
 
         const data = await response.json();
-        console.log("Received parcels data:", data.length, "items");
-        setParcels(data);
+        // Lista paczek jest stronicowana kursorem - paczki są w polu results, kolejne strony pod linkiem next
+        const allParcels = await fetchRemainingPages<Parcel>(data, {
+          credentials: "include",
+          headers: { Accept: "application/json" },
+          signal: controller.signal,
+        });
+        console.log("Received parcels data:", allParcels.length, "items");
+        setParcels(allParcels);
         setError(null);
       } catch (error: any) {
         if (error.name === "AbortError") return;
@@ -270,7 +277,6 @@ export default function DashboardPage() {
       parcel_locker: "",
       size: "small",
       receiver: "",
-      pickup_code: "",
     });
     const [isSubmitting, setIsSubmitting] = useState(false);
     const [error, setError] = useState<string | null>(null);
@@ -673,24 +679,6 @@ export default function DashboardPage() {
                 </select>
               </div>
 
-              <div>
-                <label className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-1 font-sans">
-                  Kod odbioru
-                </label>
-                <input
-                  type="text"
-                  value={formData.pickup_code}
-                  onChange={(e) =>
-                    setFormData((prev) => ({
-                      ...prev,
-                      pickup_code: e.target.value,
-                    }))
-                  }
-                  className="w-full px-3 py-2 border border-gray-300 dark:border-gray-600 rounded-lg focus:ring-blue-500 focus:border-blue-500 bg-white dark:bg-gray-700 text-gray-900 dark:text-white"
-                  required
-                />
-              </div>
-
               <div className="flex justify-end space-x-3 pt-4">
                 <button
                   type="button"
@@ -765,7 +753,7 @@ export default function DashboardPage() {
   };
 
   // Komponent karty paczki
-  const ParcelCard = ({ parcel, onPickup }: { parcel: Parcel, onPickup: (trackingNumber: string) => void }) => (
+  const ParcelCard = ({ parcel, onPickup }: { parcel: Parcel, onPickup: (parcel: Parcel) => void }) => (
     <motion.div
       initial={{ opacity: 0, y: 10 }}
       animate={{ opacity: 1, y: 0 }}
@@ -836,7 +824,7 @@ export default function DashboardPage() {
           {parcel.status === "awaiting_pickup" ? (
             <button
               className="ml-auto px-3 py-1 text-sm bg-green-600 text-white rounded hover:bg-green-700"
-              onClick={() => onPickup(parcel.tracking_number)}
+              onClick={() => onPickup(parcel)}
             >
               Odbierz paczkę
             </button>
@@ -964,7 +952,7 @@ export default function DashboardPage() {
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
             <AnimatePresence>
               {sortedParcels.map((parcel) => (
-                <ParcelCard key={parcel.id} parcel={parcel} onPickup={setPickupModalTracking} />
+                <ParcelCard key={parcel.id} parcel={parcel} onPickup={setPickupModalParcel} />
               ))}
             </AnimatePresence>
           </div>
@@ -981,8 +969,12 @@ export default function DashboardPage() {
         )}
       </AnimatePresence>
       {/* Modal do odbioru paczki */}
-      {pickupModalTracking && (
-        <ParcelPickupModal trackingNumber={pickupModalTracking} onClose={() => setPickupModalTracking(null)} />
+      {pickupModalParcel && (
+        <ParcelPickupModal
+          parcelId={pickupModalParcel.id}
+          trackingNumber={pickupModalParcel.tracking_number}
+          onClose={() => setPickupModalParcel(null)}
+        />
       )}
       {/* Modal do szczegółów paczki */}
       <AnimatePresence>
@@ -15,6 +15,7 @@ import {
   Eye
 } from 'lucide-react';
 import { useRouter } from 'next/navigation';
+import { fetchRemainingPages } from '@/lib/utils';
 interface LockerSlotInfo {
   id: number;
   parcel_locker: number;
@@ -110,7 +111,7 @@ const AdminDashboard = () => {
   const fetchParcels = async () => {
     try {
       setIsLoading(true);
-      const response = await fetch("http://localhost:8000/api/parcels/", {
+      const response = await fetch("http://localhost:8000/api/parcels/?page_size=500", {
         credentials: "include",
       });
       
@@ -119,7 +120,8 @@ const AdminDashboard = () => {
       }
       
       const data = await response.json();
-      setParcels(Array.isArray(data) ? data : []);
+      // Lista paczek jest stronicowana kursorem - paczki są w polu results, kolejne strony pod linkiem next
+      setParcels(Array.isArray(data.results) ? await fetchRemainingPages<Parcel>(data, { credentials: "include" }) : []);
     } catch (error) {
       console.error("Error fetching parcels:", error);
     } finally {
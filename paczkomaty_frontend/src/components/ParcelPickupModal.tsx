@@ -2,7 +2,7 @@ import React from "react";
 import { useState } from "react";
 import { QRCodeSVG } from 'qrcode.react';
 
-export const ParcelPickupModal = ({ trackingNumber, onClose }: { trackingNumber: string, onClose: () => void }) => {
+export const ParcelPickupModal = ({ parcelId, trackingNumber, onClose }: { parcelId: number, trackingNumber: string, onClose: () => void }) => {
   // Possible pickup methods
   type PickupMethod = "select" | "qr" | "code" | "locker";
   const [pickupMethod, setPickupMethod] = useState<PickupMethod>("select");
@@ -16,34 +16,45 @@ export const ParcelPickupModal = ({ trackingNumber, onClose }: { trackingNumber:
   const [qrGenerated, setQrGenerated] = useState(false);
   const [qrThankYou, setQrThankYou] = useState(false);
 
+  // Pobiera kod odbioru (dostępny tylko dla odbiorcy paczki); null i komunikat, gdy się nie uda
+  const fetchPickupCode = async (): Promise<string | null> => {
+    const codeRes = await fetch(`http://localhost:8000/api/get_pickup_code/`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'include',
+      body: JSON.stringify({ tracking_number: trackingNumber })
+    });
+    const codeData = await codeRes.json();
+    if (!codeRes.ok || !codeData.pickup_code) {
+      setMessage(codeData.detail || "Nie udało się pobrać kodu odbioru");
+      setIsLoading(false);
+      return null;
+    }
+    return codeData.pickup_code;
+  };
+
+  // Odbiór paczki - serwer sprawdza kod odbioru i zwalnia skrytkę
+  const pickUpParcel = (code: string) =>
+    fetch(`http://localhost:8000/api/parcels/${parcelId}/pickup/`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'include',
+      body: JSON.stringify({ pickup_code: code })
+    });
+
   const handleShowPickupCode = async () => {
     setIsLoading(true);
     setMessage(null);
     setReceivedPickupCode(null);
     try {
       // 1. Pobierz kod odbioru (wysyłamy POST)
-      const codeRes = await fetch(`http://localhost:8000/api/get_pickup_code/`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        credentials: 'include',
-        body: JSON.stringify({ tracking_number: trackingNumber })
-      });
-      const codeData = await codeRes.json();
-      if (!codeRes.ok || !codeData.pickup_code) {
-        setMessage(codeData.detail || "Nie udało się pobrać kodu odbioru");
-        setIsLoading(false);
-        return;
-      }
-      setReceivedPickupCode(codeData.pickup_code);
+      const code = await fetchPickupCode();
+      if (!code) return;
+      setReceivedPickupCode(code);
       // 2. Wyświetl kod odbioru przez 5 sekund
       setTimeout(async () => {
-        // 3. Zmieniamy status paczki na 'delivered' (wysyłamy PUT)
-        const updateRes = await fetch(`http://localhost:8000/api/update_status/`, {
-          method: 'PUT',
-          headers: { 'Content-Type': 'application/json' },
-          credentials: 'include',
-          body: JSON.stringify({ tracking_number: trackingNumber, status: 'delivered' })
-        });
+        // 3. Odbieramy paczkę tym kodem (wysyłamy POST)
+        const updateRes = await pickUpParcel(code);
         const updateData = await updateRes.json();
         if (!updateRes.ok) {
           setMessage(updateData.detail || "Nie udało się zaktualizować statusu paczki");
@@ -109,15 +120,12 @@ export const ParcelPickupModal = ({ trackingNumber, onClose }: { trackingNumber:
   const handleGenerateQRCode = () => {
     setShowQRCode(true);
     setQrGenerated(true);
-    // Po 5 sekundach wyślij PUT do update_status i pokaż animację
+    // Po 5 sekundach odbierz paczkę kodem odbioru i pokaż animację
     setTimeout(async () => {
       try {
-        const updateRes = await fetch(`http://localhost:8000/api/update_status/`, {
-          method: 'PUT',
-          headers: { 'Content-Type': 'application/json' },
-          credentials: 'include',
-          body: JSON.stringify({ tracking_number: trackingNumber, status: 'delivered' })
-        });
+        const code = await fetchPickupCode();
+        if (!code) return;
+        const updateRes = await pickUpParcel(code);
         const updateData = await updateRes.json();
         if (!updateRes.ok) {
           setMessage(updateData.detail || "Nie udało się zaktualizować statusu paczki");
@@ -143,13 +151,10 @@ export const ParcelPickupModal = ({ trackingNumber, onClose }: { trackingNumber:
     setIsLoading(true);
     setMessage(null);
     try {
-      // 1. Zmieniamy status paczki na 'delivered' (wysyłamy PUT)
-      const updateRes = await fetch(`http://localhost:8000/api/update_status/`, {
-        method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
-        credentials: 'include',
-        body: JSON.stringify({ tracking_number: trackingNumber, status: 'delivered' })
-      });
+      // 1. Odbieramy paczkę kodem odbioru (wysyłamy POST)
+      const code = await fetchPickupCode();
+      if (!code) return;
+      const updateRes = await pickUpParcel(code);
       const updateData = await updateRes.json();
       if (!updateRes.ok) {
         setMessage(updateData.detail || "Nie udało się zaktualizować statusu paczki");
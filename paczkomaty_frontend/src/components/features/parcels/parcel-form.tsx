@@ -15,7 +15,6 @@ export default function ParcelForm() {
     parcel_locker: '',
     size: 'medium',
     receiver: '',
-    pickup_code: '',
   })
 
   useEffect(() => {
@@ -125,20 +124,6 @@ export default function ParcelForm() {
         </select>
       </div>
 
-      <div>
-        <label htmlFor="pickup_code" className="block text-sm font-medium text-gray-700">
-          Kod odbioru
-        </label>
-        <input
-          type="text"
-          id="pickup_code"
-          className="input-field mt-1"
-          value={formData.pickup_code}
-          onChange={(e) => setFormData({ ...formData, pickup_code: e.target.value })}
-          required
-        />
-      </div>
-
       <button
         type="submit"
         className="btn-primary w-full"
@@ -32,8 +32,7 @@ export default function SendParcelModal({ isOpen, onClose, onSuccess }: SendParc
     tracking_number: "",
     parcel_locker: "",
     size: "small",
-    receiver: "",
-    pickup_code: ""
+    receiver: ""
   });
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -193,19 +192,6 @@ export default function SendParcelModal({ isOpen, onClose, onSuccess }: SendParc
             </select>
           </div>
 
-          <div>
-            <label className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-1 font-sans">
-              Kod odbioru
-            </label>
-            <input
-              type="text"
-              value={formData.pickup_code}
-              onChange={(e) => setFormData(prev => ({ ...prev, pickup_code: e.target.value }))}
-              className="w-full px-3 py-2 border border-gray-300 dark:border-gray-600 rounded-lg focus:ring-blue-500 focus:border-blue-500 bg-white dark:bg-gray-700 text-gray-900 dark:text-white"
-              required
-            />
-          </div>
-          
           <div className="flex justify-end space-x-3 pt-4">
             <button 
               type="button"
@@ -21,7 +21,6 @@ export interface Parcel {
   sender_username?: string
   receiver: number
   receiver_username?: string
-  pickup_code?: string
   created_at: string
 }
 
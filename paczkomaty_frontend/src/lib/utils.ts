@@ -45,6 +45,27 @@ export const fetchWithAuth = async (endpoint: string, options: RequestInit = {})
   }
 }
 
+// Cursor-paginated API lists: collect the results of the pages after `firstPage` by following `next`
+export const fetchRemainingPages = async <T>(
+  firstPage: { results: T[]; next: string | null },
+  options: RequestInit = {}
+): Promise<T[]> => {
+  const results = [...firstPage.results]
+  let next = firstPage.next
+
+  while (next) {
+    const response = await fetch(next, options)
+    if (!response.ok) {
+      throw new Error('API request failed')
+    }
+    const page = await response.json()
+    results.push(...page.results)
+    next = page.next
+  }
+
+  return results
+}
+
 export const formatDate = (date: string) => {
   if (!date) return ''
   